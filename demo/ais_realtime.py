@@ -1,16 +1,174 @@
+import os, sys
+import numpy as np
 import pandas as pd
 from geopy.distance import geodesic
-import pyproj
 from math import radians, cos, sin, tan, atan2, degrees
 import math
-import socket
+import asyncio, threading
 from datetime import datetime
 from pyais import decode
+from nmea_codec import decode_lines
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.ais_index import feed_mask
+from utils.camera import CameraModel, GEOD
+
+# first payload character of the static reports that carry ship_type (types 5 and 24)
+STATIC_TYPES = ('5', 'H')
+
+class AISIngest(object):
+    """
+    Asyncio NMEA reader running on its own thread. Bytes from the TCP feed are
+    framed by newline, multi-fragment AIVDM/AIVDO messages are reassembled,
+    each received chunk is decoded as one batch (nmea_codec.decode_lines) and
+    published into a latest state table (mmsi -> row) that the frame loop
+    copies without blocking.
+    """
+    def __init__(self, host, port, max_age=600, reconnect=1.0):
+        self.host = host
+        self.port = port
+        self.max_age = max_age
+        self.reconnect = reconnect
+        self.table = {}
+        self.ship_type = {}
+        self.fragments = {}
+        self.lock = threading.Lock()
+        self.received = 0
+        self.decoded = 0
+        self.errors = 0
+        self.loop = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(lambda: None)
+        self.thread.join(timeout=self.reconnect + 1)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.serve())
+        self.loop.close()
+
+    async def serve(self):
+        while not self.stop_event.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(self.reconnect)
+                continue
+            try:
+                await self.read(reader)
+            except OSError:
+                await asyncio.sleep(self.reconnect)
+            finally:
+                writer.close()
+
+    async def read(self, reader):
+        buffer = b''
+        while not self.stop_event.is_set():
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), timeout=self.reconnect)
+            except asyncio.TimeoutError:
+                continue
+            if not chunk:
+                print("connection closed")
+                return
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            self.publish(self.decode_batch(self.frame(lines)))
+
+    def frame(self, lines):
+        """Complete messages (lists of fragments) contained in a batch of lines."""
+        messages = []
+        for line in lines:
+            sentence = line.strip().decode('ascii', 'ignore')
+            if not sentence.startswith('!'):
+                continue
+            self.received += 1
+            fields = sentence.split(',')
+            if len(fields) < 7:
+                self.errors += 1
+                continue
+            try:
+                count, number = int(fields[1]), int(fields[2])
+            except ValueError:
+                self.errors += 1
+                continue
+            if count == 1:
+                messages.append([sentence])
+                continue
+            key = (fields[3], fields[4])
+            if number == 1:
+                self.fragments[key] = [sentence]
+            elif key in self.fragments and len(self.fragments[key]) == number - 1:
+                self.fragments[key].append(sentence)
+            else:
+                self.fragments.pop(key, None)
+                self.errors += 1
+                continue
+            if number == count:
+                messages.append(self.fragments.pop(key))
+        return messages
+
+    def decode_batch(self, messages):
+        stamp = int(datetime.utcnow().timestamp() * 1000)  # ms cinsinden
+        lines = []
+        for fragments in messages:
+            if fragments[0].split(',')[5][:1] not in STATIC_TYPES:
+                lines.extend(fragments)
+                continue
+            # static reports only update the ship type of the vessel
+            try:
+                msg = decode(*fragments)
+            except Exception:
+                self.errors += 1
+                continue
+            self.decoded += 1
+            if getattr(msg, 'ship_type', None) is not None:
+                self.ship_type[msg.mmsi] = int(msg.ship_type)
+
+        block = decode_lines(lines)
+        self.decoded += len(block)
+        rows = pd.DataFrame({
+            'mmsi': block['mmsi'].astype('int64'),
+            'lon': block['lon'],
+            'lat': block['lat'],
+            'speed': block['speed'],
+            'course': block['course'],
+            'heading': block['heading'],
+            'type': None,
+            'timestamp': stamp})
+        return rows.to_dict('records')
+
+    def publish(self, rows):
+        if not rows:
+            return
+        with self.lock:
+            for row in rows:
+                if row['type'] is None:
+                    row['type'] = self.ship_type.get(row['mmsi'])
+                self.table[row['mmsi']] = row
+
+    def snapshot(self):
+        """Latest report of every vessel heard within max_age seconds."""
+        limit = int(datetime.utcnow().timestamp() * 1000) - self.max_age * 1000
+        with self.lock:
+            for mmsi in [mmsi for mmsi, row in self.table.items() if row['timestamp'] < limit]:
+                del self.table[mmsi]
+            rows = list(self.table.values())
+        return pd.DataFrame(rows, columns=['mmsi','lon','lat','speed','course','heading','type','timestamp'])
 
 class AISPRO(object):
     def __init__(self, ais_host, ais_port, im_shape, t):
         self.ais_host = ais_host
         self.ais_port = ais_port
+        self.ingest   = None
         self.im_shape = im_shape
         self.max_dis  = 2*1852
         self.t        = t
@@ -25,34 +183,20 @@ class AISPRO(object):
         AIS_cur = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','type','timestamp'])
         return AIS_cur, AIS_las, AIS_vis
     
-    def read_ais(self, sock):
-        while True:
-            line = sock.recv(48)
-            if not line:
-                print("connection closed")
-                break
-            line = line.decode().strip()
-            ais_row = self.parse_nmea(line)
-
-            if ais_row is not None:
-                yield ais_row
-
     def parse_nmea(self, nmea_sentence):
         try:
             msg = decode(nmea_sentence)
-            print("msg", msg)
             return {
                 'mmsi': msg.mmsi,
                 'lon': msg.lon,
                 'lat': msg.lat,
                 'speed': msg.speed,
                 'course': msg.course,
-                'heading': msg.heading,
+                'heading': getattr(msg, 'heading', None),
                 'type': getattr(msg, 'ship_type', None),
                 'timestamp': int(datetime.utcnow().timestamp() * 1000)  # ms cinsinden
             }
-        except Exception as e:
-            print(f"NMEA parse hatası: {e}")
+        except Exception:
             return None
 
     def data_tran(self, AIS_cur, AIS_vis, camera_para, timestamp):
@@ -66,33 +210,21 @@ class AISPRO(object):
         AIS_vis = AIS_vis.drop(AIS_vis[AIS_vis['timestamp'] < (timestamp//1000 - self.time_lim * 60)].index)
         return AIS_vis
     
-    def ais_pro(self, AIS_cur, AIS_las, AIS_vis, camera_para, timestamp, sock):
-        rows = []
-        a = self.read_ais(sock)
-        for ais_row in a:
-            rows.append(ais_row)
-            print(ais_row)
-            AIS_read = pd.DataFrame(rows, columns=['mmsi','lon','lat','speed','course','heading','type','timestamp'])
-            AIS_read = self.data_coarse_process(AIS_read, AIS_las, camera_para, self.max_dis)
-            AIS_cur = self.data_pred(AIS_cur, AIS_read, AIS_las, timestamp)
-            AIS_vis = self.data_tran(AIS_cur, AIS_vis, camera_para, timestamp)
-
-            rows.clear()
-
-            self.AIS_vis, self.AIS_cur = AIS_vis, AIS_cur
-            return self.AIS_vis, self.AIS_cur
-
-        # Veri gelmezse boş DataFrame döndür
-        return pd.DataFrame(), pd.DataFrame()
-
-    def process(self, camera_para, timestamp, sock):
-        AIS_cur, AIS_las, AIS_vis = self.initialization()
-        result = self.ais_pro(AIS_cur, AIS_las, AIS_vis, camera_para, timestamp, sock)
-        if not result:
-            # Boş DataFrame döndür
-            return pd.DataFrame(), pd.DataFrame()
-    
-        self.AIS_vis, self.AIS_cur = result
+    def ais_pro(self, AIS_cur, AIS_las, AIS_vis, camera_para, timestamp):
+        AIS_read = self.ingest.snapshot()
+        AIS_read = self.data_coarse_process(AIS_read, AIS_las, camera_para, self.max_dis)
+        AIS_cur = self.data_pred(AIS_cur, AIS_read, AIS_las, timestamp)
+        AIS_vis = self.data_tran(AIS_cur, AIS_vis, camera_para, timestamp)
+        return AIS_vis, AIS_cur
+
+    def process(self, camera_para, timestamp):
+        # veri AISIngest üzerinden gelir
+        if self.ingest is None:
+            self.ingest = AISIngest(self.ais_host, self.ais_port).start()
+
+        if timestamp % 1000 < self.t:
+            AIS_cur, AIS_las, AIS_vis = self.initialization()
+            self.AIS_vis, self.AIS_cur = self.ais_pro(AIS_cur, AIS_las, AIS_vis, camera_para, timestamp)
         return self.AIS_vis, self.AIS_cur
 
     @staticmethod
@@ -163,7 +295,6 @@ class AISPRO(object):
 
     def data_filter(self, ais, camera_para):
 
-        print(camera_para)
         lon_cam = camera_para[0]
         lat_cam = camera_para[1]
         shoot_hdir = camera_para[2]
@@ -204,73 +335,54 @@ class AISPRO(object):
                 AIS_vis = AIS_vis.drop(AIS_vis[AIS_vis['mmsi'] == ais['mmsi']].index)
         return AIS_vis, AIS_visCurrent
 
-    def data_pre(self, ais, timestamp):
+    def data_pre_batch(self, AIS_data, timestamp):
 
-        if ais['speed'] == 0:
-            ais['timestamp'] = timestamp
-        
-        else:
-            geo_d = pyproj.Geod(ellps="WGS84")
-            
-            distance = ais['speed'] * ((timestamp - ais['timestamp']) / 3600) * 1852
-            ais['timestamp'] = timestamp
+        AIS_data = AIS_data.copy()
+        lon = AIS_data['lon'].to_numpy(dtype=float, copy=True)
+        lat = AIS_data['lat'].to_numpy(dtype=float, copy=True)
+        speed = AIS_data['speed'].to_numpy(dtype=float)
+        course = AIS_data['course'].to_numpy(dtype=float)
+        stamp = AIS_data['timestamp'].to_numpy(dtype=float)
 
-            ais['lon'], ais['lat'], c = geo_d.fwd(ais['lon'], ais['lat'], ais['course'], distance)
-        return ais
+        move = (speed != 0) & (stamp != timestamp)
+        if move.any():
+            distance = speed[move] * ((timestamp - stamp[move]) / 3600) * 1852
+            lon[move], lat[move], _ = GEOD.fwd(lon[move], lat[move], course[move], distance)
+            AIS_data['lon'], AIS_data['lat'] = lon, lat
+        AIS_data['timestamp'] = timestamp
+        return AIS_data
 
     def data_pred(self, AIS_cur, AIS_read, AIS_las, timestamp):
 
         # Time offset correction - AIS data is ~5 hours behind video
         TIME_OFFSET = 5 * 3600 * 1000  # 5 hours in milliseconds
 
-        for index, ais in AIS_read.iterrows():
-            # Apply time offset to AIS timestamp
-            ais['timestamp'] = ais['timestamp'] + TIME_OFFSET
-            ais['timestamp'] = round(ais['timestamp']/1000)
-            
-            if ais['timestamp'] == int(timestamp//1000):
-                AIS_cur = pd.concat([AIS_cur, ais.to_frame().T], ignore_index=True)
-            
-            else:
-                predicted_data = self.data_pre(ais, timestamp//1000)
-                AIS_cur = pd.concat([AIS_cur, predicted_data.to_frame().T], ignore_index=True)
-        
-        for index, ais in AIS_las.iterrows():
-            if ais['mmsi'] not in AIS_cur['mmsi'].values:
-                predicted_data = self.data_pre(ais, timestamp//1000)
-                AIS_cur = pd.concat([AIS_cur, predicted_data.to_frame().T], ignore_index=True)
-        return AIS_cur
+        AIS_read = AIS_read.copy()
+        AIS_read['timestamp'] = np.round((AIS_read['timestamp'].to_numpy(dtype=float) + TIME_OFFSET) / 1000)
+        # vessels missing from the snapshot are carried over from the last second
+        AIS_las = AIS_las[~AIS_las['mmsi'].isin(AIS_read['mmsi'])]
+        frames = [frame for frame in (AIS_cur, AIS_read, AIS_las) if len(frame)]
+        AIS_cur = pd.concat(frames, ignore_index=True) if frames else AIS_cur
+        return self.data_pre_batch(AIS_cur, timestamp//1000)
 
     def data_coarse_process(self, AIS_current,AIS_last,camera_para,max_dis):
 
-        camera_loc = (camera_para[1], camera_para[0])
-        
-        for index, ais in AIS_current.iterrows():
-            flag = 0
-            
-            if ais['mmsi'] / 100000000 < 1 or ais['mmsi'] / 100000000 >= 10 or\
-                ais['lon'] == -1 or ais['lat'] == -1 or ais['speed'] == -1 or\
-                    ais['course'] == -1 or ais['course'] == 360 or ais['heading'] == -1 or ais['lon'] > 180 or\
-                        ais['lon'] < 0 or ais['lat'] > 90 or ais['lat'] < 0 or ais['speed'] <= 0.3:
-                AIS_current = AIS_current.drop(index=index)
-                continue
-
-            if ais['mmsi'] in AIS_last['mmsi'].values:
-                temp = AIS_last[AIS_last.mmsi == ais['mmsi']]
-                if not temp.empty:
-                    if abs(ais['lon'] - temp['lon'].values[-1]) >= 1 \
-                        or abs(ais['lat'] - temp['lat'].values[-1]) >= 1 \
-                        or abs(ais['speed'] - temp['speed'].values[-1]) >= 7:
-                        AIS_current = AIS_current.drop(index=index)
-                        continue
+        lon = AIS_current['lon'].to_numpy(dtype=float)
+        lat = AIS_current['lat'].to_numpy(dtype=float)
+        keep = feed_mask(AIS_current)
 
-    
-            ship_loc = (ais['lat'], ais['lon'])
-            dis = self.count_distance(camera_loc, ship_loc, Type='m')
-            if dis > max_dis or self.data_filter(ais, camera_para) == 'ais_del':
-                AIS_current = AIS_current.drop(index=index)
-        return AIS_current
+        if len(AIS_last):
+            # last report of each vessel, NaN (never a jump) for new ones
+            last = AIS_last.drop_duplicates('mmsi', keep='last')
+            last = last.set_index(last['mmsi'].to_numpy(dtype=np.int64))[['lon', 'lat', 'speed']]
+            prev = last.reindex(AIS_current['mmsi'].to_numpy(dtype=np.int64)).to_numpy(dtype=float)
+            keep &= ~((np.abs(lon - prev[:, 0]) >= 1) | (np.abs(lat - prev[:, 1]) >= 1) |\
+                (np.abs(AIS_current['speed'].to_numpy(dtype=float) - prev[:, 2]) >= 7))
 
+        dis, _ = CameraModel.get(camera_para, self.im_shape).range_bearing(lon, lat)
+        # data_filter never returns 'ais_del', the range test is the only camera check
+        keep &= ~(dis > max_dis)
+        return AIS_current[keep]
 
 # Example usage - original interface
 if __name__ == "__main__":
@@ -291,8 +403,11 @@ if __name__ == "__main__":
     
     try:
         # Original method call
-        AIS_vis, AIS_cur = aispro.process(camera_para, timestamp, sock)
+        AIS_vis, AIS_cur = aispro.process(camera_para, timestamp)
         print(f"✅ AIS processed: {len(AIS_vis)} visible, {len(AIS_cur)} current")
     except Exception as e:
         print(f"❌ Error: {e}")
-        print("(This is expected if AIS files or dependencies are missing)")
\ No newline at end of file
+        print("(This is expected if AIS files or dependencies are missing)")
+    finally:
+        if aispro.ingest is not None:
+            aispro.ingest.stop()
\ No newline at end of file
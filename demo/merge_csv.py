@@ -1,15 +1,137 @@
+import os, sys, glob, heapq, shutil, tempfile, time, argparse
+import numpy as np
 import pandas as pd
-from glob import glob
 
-# Tüm CSV dosyalarını oku
-files = glob("ais/*.csv")
-df_list = [pd.read_csv(f) for f in files]
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.ais_archive import COLUMNS, ArchiveWriter, read_second
 
-# Birleştir
-df_all = pd.concat(df_list, ignore_index=True)
+class CsvWriter(object):
+    def __init__(self, path):
 
-# timestamp’e göre sırala
-df_all = df_all.sort_values(by="timestamp").reset_index(drop=True)
+        self.f = open(path, 'w', newline='')
+        self.f.write(','.join(COLUMNS) + '\n')
 
-# Tek dosya olarak kaydet
-df_all.to_csv("ais_all_sorted.csv", index=False)
\ No newline at end of file
+    def write(self, block):
+
+        # heading/type are float to hold blanks, written back as integers
+        block.astype({'heading': 'Int64', 'type': 'Int64'}).to_csv(self.f, header=False, index=False)
+
+    def close(self):
+        self.f.close()
+
+class NmeaWriter(object):
+    """Type 1 position reports, same fields as to_nmea.py."""
+    def __init__(self, path):
+
+        from nmea_codec import encode_frame
+        self.encode_frame = encode_frame
+        self.f = open(path, 'w')
+
+    def write(self, block):
+        self.f.write(self.encode_frame(block))
+
+    def close(self):
+        self.f.close()
+
+def write_run(frames, run_path):
+    """Sort one chunk of per-second files by timestamp and spill it as .npy columns."""
+    chunk = pd.concat(frames, ignore_index=True)
+    order = np.argsort(chunk['timestamp'].to_numpy(), kind='stable')
+    os.makedirs(run_path)
+    for column in COLUMNS:
+        np.save(os.path.join(run_path, column + '.npy'), chunk[column].to_numpy()[order])
+    return run_path
+
+def make_runs(files, tmp_path, chunk_rows, archive=None):
+    """Pass 1: read the per-second files in name order, in chunks of ~chunk_rows rows."""
+    runs, frames, rows = [], [], 0
+    for file in files:
+        ais_data = read_second(file)
+        if archive is not None:
+            archive.write(os.path.splitext(os.path.basename(file))[0], ais_data)
+        frames.append(ais_data)
+        rows += len(ais_data)
+        if rows >= chunk_rows:
+            runs.append(write_run(frames, os.path.join(tmp_path, 'run_%05d' % len(runs))))
+            frames, rows = [], 0
+    if rows:
+        runs.append(write_run(frames, os.path.join(tmp_path, 'run_%05d' % len(runs))))
+    return runs
+
+def merge_runs(runs, block_rows):
+    """
+    Pass 2: heap based k-way merge of the sorted runs on timestamp, block by block.
+
+    The heap holds (last timestamp, run) of every run's current block. Its minimum is a
+    bound no row still to come sorts before, so the buffered rows up to it are final;
+    they are emitted as one stably sorted block. Ties keep run, i.e. file, order.
+    """
+    runs = [{column: np.load(os.path.join(run, column + '.npy'), mmap_mode='r') for column in COLUMNS} for run in runs]
+    pos = [0] * len(runs)
+    end = [min(block_rows, len(run['timestamp'])) for run in runs]
+    heap = [(int(run['timestamp'][end[i] - 1]), i) for i, run in enumerate(runs) if end[i]]
+    heapq.heapify(heap)
+
+    while heap:
+        bound, i = heapq.heappop(heap)
+        if pos[i] == end[i] or int(runs[i]['timestamp'][end[i] - 1]) != bound:
+            continue
+        parts = []
+        for j, run in enumerate(runs):
+            if pos[j] == end[j]:
+                continue
+            n = int(np.searchsorted(run['timestamp'][pos[j]:end[j]], bound, side='right' if j <= i else 'left'))
+            if n:
+                parts.append({column: np.asarray(run[column][pos[j]:pos[j] + n]) for column in COLUMNS})
+                pos[j] += n
+            if pos[j] == end[j]:
+                end[j] = min(pos[j] + block_rows, len(run['timestamp']))
+                if end[j] > pos[j]:
+                    heapq.heappush(heap, (int(run['timestamp'][end[j] - 1]), j))
+        block = pd.DataFrame({column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}, columns=COLUMNS)
+        order = np.argsort(block['timestamp'].to_numpy(), kind='stable')
+        yield block.iloc[order]
+
+def merge(ais_path, out_csv=None, out_nmea=None, archive_path=None, chunk_rows=1000000, block_rows=100000):
+
+    start = time.time()
+    files = sorted(glob.glob(os.path.join(ais_path, '*.csv')))
+    tmp_path = tempfile.mkdtemp(prefix='ais_merge_')
+    archive = ArchiveWriter(archive_path) if archive_path else None
+    writers = []
+    if out_csv:
+        writers.append(CsvWriter(out_csv))
+    if out_nmea:
+        writers.append(NmeaWriter(out_nmea))
+    try:
+        runs = make_runs(files, tmp_path, chunk_rows, archive)
+        if archive is not None:
+            archive.close()
+        read_time = time.time() - start
+
+        rows = 0
+        for block in merge_runs(runs, block_rows):
+            for writer in writers:
+                writer.write(block)
+            rows += len(block)
+    finally:
+        for writer in writers:
+            writer.close()
+        shutil.rmtree(tmp_path)
+
+    total = time.time() - start
+    print('Files: %d || Runs: %d || Rows: %d || Read: %.2fs || Total: %.2fs || %.0f rows/s'
+          % (len(files), len(runs), rows, read_time, total, rows / max(total, 1e-9)))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Streaming k-way merge of per-second AIS csv files")
+    parser.add_argument("--ais_path", type=str, default = 'ais', help='per-second AIS csv directory')
+    parser.add_argument("--out_csv", type=str, default = 'ais_all_sorted.csv', help='timestamp sorted csv, empty to skip')
+    parser.add_argument("--out_nmea", type=str, default = '', help='timestamp sorted NMEA, empty to skip')
+    parser.add_argument("--archive", type=str, default = '', help='columnar archive (main.py --ais_archive), empty to skip')
+    parser.add_argument("--chunk_rows", type=int, default = 1000000, help='rows sorted in memory per run')
+    parser.add_argument("--block_rows", type=int, default = 100000, help='rows read per run and merge step')
+    arg = parser.parse_args()
+
+    merge(arg.ais_path, arg.out_csv, arg.out_nmea, arg.archive, arg.chunk_rows, arg.block_rows)
@@ -0,0 +1,205 @@
+import os, time, argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Bulk AIVDM/AIVDO codec. Type 1 position reports are encoded and single-fragment
+# type 1/2/3 sentences are decoded with numpy bit operations; anything else goes
+# through pyais. Values follow pyais conventions bit for bit (speed/course are
+# truncated, lon/lat rounded, decoded lon/lat rounded to 6 digits).
+
+# (name, width, signed) of a type 1/2/3 payload, 168 bits = 28 armored characters
+POSITION_FIELDS = [('msg_type', 6, False), ('repeat', 2, False), ('mmsi', 30, False), ('status', 4, False),
+                   ('turn', 8, True), ('speed', 10, False), ('accuracy', 1, False), ('lon', 28, True),
+                   ('lat', 27, True), ('course', 12, False), ('heading', 9, False), ('second', 6, False),
+                   ('maneuver', 2, False), ('spare', 3, False), ('raim', 1, False), ('radio', 19, False)]
+PAYLOAD_CHARS = 28
+DECODE_COLUMNS = ['msg_type', 'mmsi', 'lon', 'lat', 'speed', 'course', 'heading', 'second']
+POSITION_TYPES = (1, 2, 3, 18, 19, 27)
+
+ARMOR = np.array([c + 48 if c < 40 else c + 56 for c in range(64)], dtype=np.uint8)
+DEARMOR = np.zeros(256, dtype=np.uint8)
+DEARMOR[ARMOR] = np.arange(64)
+HEX = np.array([list(b'%02X' % i) for i in range(256)], dtype=np.uint8)
+
+def xor_reduce(text):
+    value = 0
+    for c in text.encode():
+        value ^= c
+    return value
+
+def field_bits(value, width):
+    """Low `width` bits of an int64 array, most significant first, as an n x width uint8 matrix."""
+    return np.unpackbits(value.astype('>i8').view(np.uint8).reshape(-1, 8), axis=1)[:, 64 - width:]
+
+def bits_value(bits):
+    """Unsigned integers of an n x width (width <= 32) uint8 bit matrix, most significant first."""
+    padded = np.zeros((len(bits), 32), dtype=np.uint8)
+    padded[:, 32 - bits.shape[1]:] = bits
+    return np.packbits(padded, axis=1).view('>u4').ravel().astype(np.int64)
+
+def encode_frame(df, talker='AIVDO', channel='A'):
+    """
+    Type 1 sentences (to_nmea.py fields) for every row of df, one per line, in row order.
+    Rows with missing values are skipped, as encode_dict failures were.
+    """
+    values = {name: np.zeros(len(df), dtype=np.int64) for name, _, _ in POSITION_FIELDS}
+    data = df[['mmsi', 'speed', 'lon', 'lat', 'course', 'heading', 'timestamp']].to_numpy(dtype=float)
+    valid = ~np.isnan(data).any(axis=1)
+    data = data[valid]
+    values = {name: value[valid] for name, value in values.items()}
+    values['msg_type'][:] = 1
+    values['accuracy'][:] = 1
+    values['mmsi']    = data[:, 0].astype(np.int64)
+    values['speed']   = np.trunc(data[:, 1] * 10.0).astype(np.int64)
+    values['lon']     = np.rint(data[:, 2] * 600000.0).astype(np.int64)
+    values['lat']     = np.rint(data[:, 3] * 600000.0).astype(np.int64)
+    values['course']  = np.trunc(data[:, 4] * 10.0).astype(np.int64)
+    values['heading'] = data[:, 5].astype(np.int64)
+    values['second']  = (data[:, 6].astype(np.int64) // 1000) % 60
+
+    # one uint8 per bit (168 bytes a row); sextets are packed as 00xxxxxx bytes
+    bits = np.concatenate([field_bits(values[name], width) for name, width, _ in POSITION_FIELDS], axis=1)
+    sextets = np.zeros((len(bits), PAYLOAD_CHARS, 8), dtype=np.uint8)
+    sextets[:, :, 2:] = bits.reshape(-1, PAYLOAD_CHARS, 6)
+    payload = ARMOR[np.packbits(sextets, axis=2)[:, :, 0]]
+
+    head = np.frombuffer(('!%s,1,1,,%s,' % (talker, channel)).encode(), dtype=np.uint8)
+    tail = np.frombuffer(b',0*', dtype=np.uint8)
+    checksum = np.bitwise_xor.reduce(payload, axis=1) ^ xor_reduce('%s,1,1,,%s,,0' % (talker, channel))
+    lines = np.concatenate([np.broadcast_to(head, (len(payload), len(head))), payload,
+                            np.broadcast_to(tail, (len(payload), len(tail))), HEX[checksum],
+                            np.full((len(payload), 1), ord('\n'), dtype=np.uint8)], axis=1)
+    return lines.tobytes().decode('ascii')
+
+def position_row(msg):
+
+    row = {column: getattr(msg, column, None) for column in DECODE_COLUMNS}
+    row['msg_type'] = msg.msg_type
+    return row
+
+def decode_lines(lines):
+    """
+    Position reports of a list of sentences as a DataFrame (DECODE_COLUMNS), in input
+    order. Multi-fragment messages must not be split across calls.
+    """
+    from pyais import decode
+
+    fast, fast_index, slow, fragments = [], [], [], []
+    for i, line in enumerate(lines):
+        line = line.strip()
+        parts = line.split(',')
+        if len(parts) != 7:
+            continue
+        if parts[1] == '1' and len(parts[5]) == PAYLOAD_CHARS and parts[5][0] in '123':
+            fast.append(parts[5])
+            fast_index.append(i)
+            continue
+        fragments.append(line)
+        if parts[1] == parts[2]:
+            slow.append((i, fragments))
+            fragments = []
+
+    rows, index = [], []
+    for i, message in slow:
+        try:
+            msg = decode(*message)
+        except Exception:
+            continue
+        if msg.msg_type in POSITION_TYPES:
+            rows.append(position_row(msg))
+            index.append(i)
+    decoded = pd.DataFrame(rows, columns=DECODE_COLUMNS)
+
+    if fast:
+        sextets = DEARMOR[np.frombuffer(''.join(fast).encode(), dtype=np.uint8)].reshape(-1, PAYLOAD_CHARS)
+        bits = np.unpackbits(sextets[:, :, None], axis=2)[:, :, 2:].reshape(len(fast), -1)
+        fields, offset = {}, 0
+        for name, width, signed in POSITION_FIELDS:
+            value = bits_value(bits[:, offset:offset + width])
+            if signed:
+                value = np.where(value >= 1 << (width - 1), value - (1 << width), value)
+            fields[name] = value
+            offset += width
+        block = pd.DataFrame({
+            'msg_type': fields['msg_type'],
+            'mmsi': fields['mmsi'],
+            # round(v / 600000, 6) == nearest integer of 5v/3, over 1e6
+            'lon': ((10 * fields['lon'] + 3) // 6) / 1e6,
+            'lat': ((10 * fields['lat'] + 3) // 6) / 1e6,
+            'speed': fields['speed'] / 10.0,
+            'course': fields['course'] / 10.0,
+            'heading': fields['heading'],
+            'second': fields['second']}, columns=DECODE_COLUMNS)
+        decoded = block if not len(decoded) else pd.concat([block, decoded], ignore_index=True)
+        index = fast_index + index
+
+    order = np.argsort(np.asarray(index, dtype=np.int64), kind='stable')
+    return decoded.iloc[order].reset_index(drop=True)
+
+def line_chunks(f, chunk_lines):
+    """Lists of ~chunk_lines lines, cut only before the first fragment of a message."""
+    chunk = []
+    for line in f:
+        if len(chunk) >= chunk_lines and line.split(',', 3)[2:3] in (['1'], []):
+            yield chunk
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+def ordered_map(fn, chunks, workers, window=None):
+    """Results of fn over chunks in input order, with at most `window` chunks in flight."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield fn(chunk)
+        return
+    window = window or 2 * workers
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(fn, chunk))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def encode_csv(csv_path, nmea_path, workers=os.cpu_count(), chunk_rows=100000):
+
+    start, rows = time.time(), 0
+    with open(nmea_path, 'w') as f:
+        # ais_all_sorted_space.txt is space separated
+        reader = pd.read_csv(csv_path, sep=' ' if csv_path.endswith('.txt') else ',', chunksize=chunk_rows)
+        for text in ordered_map(encode_frame, reader, workers):
+            f.write(text)
+            rows += text.count('\n')
+    elapsed = time.time() - start
+    print('Encoded: %d || %.2fs || %.0f msg/s' % (rows, elapsed, rows / max(elapsed, 1e-9)))
+    return rows
+
+def decode_nmea(nmea_path, csv_path, workers=os.cpu_count(), chunk_lines=100000):
+
+    start, rows = time.time(), 0
+    with open(nmea_path) as f, open(csv_path, 'w', newline='') as out:
+        out.write(','.join(DECODE_COLUMNS) + '\n')
+        for block in ordered_map(decode_lines, line_chunks(f, chunk_lines), workers):
+            block.to_csv(out, header=False, index=False)
+            rows += len(block)
+    elapsed = time.time() - start
+    print('Decoded: %d || %.2fs || %.0f msg/s' % (rows, elapsed, rows / max(elapsed, 1e-9)))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Bulk AIS NMEA encoder/decoder")
+    parser.add_argument("mode", type=str, choices=['encode', 'decode'], help='csv -> nmea or nmea -> csv')
+    parser.add_argument("src", type=str, help='input file')
+    parser.add_argument("dst", type=str, help='output file')
+    parser.add_argument("--workers", type=int, default = os.cpu_count(), help='worker processes, 1 runs in-process')
+    parser.add_argument("--chunk", type=int, default = 100000, help='rows/lines per chunk')
+    arg = parser.parse_args()
+
+    if arg.mode == 'encode':
+        encode_csv(arg.src, arg.dst, arg.workers, arg.chunk)
+    else:
+        decode_nmea(arg.src, arg.dst, arg.workers, arg.chunk)
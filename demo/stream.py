@@ -1,23 +1,177 @@
 import socket
-import time
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+from nmea_codec import encode_frame
 
 HOST = "127.0.0.1"
 PORT = 10110
+FAST_BATCH = 10000
 
-def stream_nmea(file_path):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT))
-        s.listen()
-        
-        conn, addr = s.accept()
-        with open(file_path, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                conn.sendall((line + "\n").encode())
-                print(f"AIS gönderildi: {line}")
-                time.sleep(0.5) 
+class ReplayServer(object):
+    """
+    Replays a timestamp sorted AIS csv (merge_csv.py output) as NMEA to every
+    connected TCP client and optionally to a UDP multicast group.
+
+    Messages are paced by their own timestamps divided by speed (0 = as fast as
+    possible). Everything due within one batch interval goes out as a single
+    write per client / a few datagrams, and the achieved rate is printed.
+    Paced replay drops clients that fall max_buffer bytes behind; unpaced
+    replay waits for the slowest client instead.
+    """
+    def __init__(self, csv_path, host=HOST, port=PORT, speed=1.0, batch=0.01, multicast=None,
+                 wait_clients=1, max_buffer=16 << 20, report=5.0, chunk_rows=100000):
+
+        self.csv_path = csv_path
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.batch = batch
+        self.multicast = multicast
+        self.wait_clients = wait_clients
+        self.max_buffer = max_buffer
+        self.report = report
+        self.chunk_rows = chunk_rows
+        self.clients = set()
+        self.udp = None
+        self.sent = 0
+
+    async def on_client(self, reader, writer):
+
+        print(f"client connected: {writer.get_extra_info('peername')}")
+        self.clients.add(writer)
+        try:
+            # clients only listen, wait for them to hang up
+            while await reader.read(4096):
+                pass
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def open_multicast(self):
+
+        group, port = self.multicast
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.udp.setblocking(False)
+        self.udp_addr = (group, port)
+
+    def send_udp(self, lines):
+
+        # one datagram per ~1400 bytes of whole sentences
+        datagram, size = [], 0
+        for line in lines:
+            if size + len(line) > 1400 and datagram:
+                self.sendto(b''.join(datagram))
+                datagram, size = [], 0
+            datagram.append(line)
+            size += len(line)
+        if datagram:
+            self.sendto(b''.join(datagram))
+
+    def sendto(self, data):
+        try:
+            self.udp.sendto(data, self.udp_addr)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    async def send(self, lines):
+
+        data = b''.join(lines)
+        for writer in list(self.clients):
+            if self.speed <= 0:
+                writer.write(data)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    self.clients.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                print(f"client too slow, dropped: {writer.get_extra_info('peername')}")
+                self.clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+        if self.udp is not None:
+            self.send_udp(lines)
+        self.sent += len(lines)
+        # yield so slow clients get flushed and new clients accepted
+        await asyncio.sleep(0)
+
+    def chunks(self):
+        """(timestamps [ms], NMEA lines) per csv chunk, rows without a complete report dropped."""
+        for df in pd.read_csv(self.csv_path, chunksize=self.chunk_rows):
+            df = df.dropna(subset=['mmsi', 'speed', 'lon', 'lat', 'course', 'heading', 'timestamp'])
+            lines = encode_frame(df).encode().splitlines(keepends=True)
+            yield df['timestamp'].to_numpy(dtype=np.int64), lines
+
+    async def replay(self):
+
+        loop = asyncio.get_running_loop()
+        start = last_report = loop.time()
+        ts0, last_sent = None, 0
+        for stamps, lines in self.chunks():
+            if ts0 is None and len(stamps):
+                ts0 = stamps[0]
+            i = 0
+            while i < len(lines):
+                now = loop.time()
+                if self.speed > 0:
+                    due = (stamps[i] - ts0) / 1000 / self.speed
+                    if due > now - start:
+                        await asyncio.sleep(due - (now - start))
+                        now = loop.time()
+                    # everything due before the end of this batch interval
+                    limit = ts0 + (now - start + self.batch) * 1000 * self.speed
+                    j = max(int(np.searchsorted(stamps, limit, side='right')), i + 1)
+                else:
+                    j = min(i + FAST_BATCH, len(lines))
+                await self.send(lines[i:j])
+                i = j
+
+                if now - last_report >= self.report:
+                    print('sent: %d || clients: %d || %.0f msg/s' % (self.sent, len(self.clients), (self.sent - last_sent) / (now - last_report)))
+                    last_report, last_sent = now, self.sent
+        elapsed = loop.time() - start
+        print('done: %d messages || %.2fs || %.0f msg/s' % (self.sent, elapsed, self.sent / max(elapsed, 1e-9)))
+
+    async def serve(self):
+
+        server = await asyncio.start_server(self.on_client, self.host, self.port)
+        if self.multicast:
+            self.open_multicast()
+        print(f"replay server on {self.host}:{self.port}, waiting for {self.wait_clients} client(s)")
+        async with server:
+            while len(self.clients) < self.wait_clients:
+                await asyncio.sleep(0.05)
+            await self.replay()
+            for writer in list(self.clients):
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+                writer.close()
+
+    def run(self):
+        asyncio.run(self.serve())
 
 if __name__ == "__main__":
-    stream_nmea("ais_all_sorted2.nmea")
+    parser = argparse.ArgumentParser(description = "AIS NMEA replay server")
+    parser.add_argument("--csv", type=str, default = 'ais_all_sorted.csv', help='timestamp sorted AIS csv')
+    parser.add_argument("--host", type=str, default = HOST, help='TCP listen address')
+    parser.add_argument("--port", type=int, default = PORT, help='TCP listen port')
+    parser.add_argument("--speed", type=float, default = 1.0, help='replay speed factor, 0 = as fast as possible')
+    parser.add_argument("--batch", type=float, default = 0.01, help='seconds of messages sent per write')
+    parser.add_argument("--multicast", type=str, default = '', help='UDP multicast group:port, empty to disable')
+    parser.add_argument("--clients", type=int, default = 1, help='TCP clients to wait for before starting, 0 starts at once')
+    parser.add_argument("--report", type=float, default = 5.0, help='rate report interval [s]')
+    arg = parser.parse_args()
+
+    multicast = None
+    if arg.multicast:
+        group, port = arg.multicast.split(':')
+        multicast = (group, int(port))
+    ReplayServer(arg.csv, arg.host, arg.port, arg.speed, arg.batch, multicast, arg.clients, report=arg.report).run()
@@ -37,7 +37,6 @@ import pandas as pd
 import numpy as np
 import warnings
 import cv2
-import socket
 warnings.filterwarnings('ignore')
 
 try:
@@ -122,7 +121,7 @@ class VesselTracker:
         self.bin_inf = pd.DataFrame(columns=['ID', 'mmsi', 'timestamp', 'match'])
         self.last_results = {}
     
-    def process_frame(self, frame, timestamp, sock, time_name=None):
+    def process_frame(self, frame, timestamp, time_name=None):
         """
         Process a single frame through the complete pipeline
         
@@ -151,7 +150,7 @@ class VesselTracker:
         # Step 1: Process AIS data
         if self.ais_processor and self.camera_parameters:
             # Yeni (realtime)
-            ais_vis, ais_cur = self.ais_processor.process(self.camera_parameters, timestamp, sock)
+            ais_vis, ais_cur = self.ais_processor.process(self.camera_parameters, timestamp)
             results['ais']['visible'] = ais_vis
             results['ais']['current'] = ais_cur
         else:
@@ -366,9 +365,6 @@ if __name__ == "__main__":
         }
     }
     
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((config['ais_config']['host'], config['ais_config']['port']))
-
     # Initialize tracker
     tracker = VesselTracker(**config)
     
@@ -390,7 +386,7 @@ if __name__ == "__main__":
         time_name = None  # Gerekirse video adı veya zaman etiketi
 
         # Tracker ile işle
-        results, overlay_frame = tracker.process_frame(frame, timestamp, sock, time_name)
+        results, overlay_frame = tracker.process_frame(frame, timestamp, time_name=time_name)
 
         # Overlay göster
         cv2.namedWindow("Overlay", cv2.WINDOW_NORMAL)
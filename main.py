@@ -1,12 +1,15 @@
 ﻿import os, time, imutils, cv2, argparse
 import pandas as pd
 import numpy as np
-from utils.file_read import read_all, ais_initial, update_time, time2stamp
+from utils.file_read import read_all, ais_initial, FrameClock
 from utils.VIS_utils import VISPRO
 from utils.AIS_utils import AISPRO
+from utils.ais_archive import AISArchive
+from utils.ais_index import AISIndex
 from utils.FUS_utils import FUSPRO
-from utils.gen_result import gen_result
+from utils.gen_result import gen_result, gen_geo
 from utils.draw import DRAW
+from utils.camera import CameraModel
 
 # Performance monitoring
 ##
@@ -31,18 +34,34 @@ def main(arg):
     ##
 
     ais_file, timestamp0, time0 = ais_initial(arg.ais_path, arg.initial_time)
-    Time = arg.initial_time.copy()
     
     cap = cv2.VideoCapture(arg.video_path)
     im_shape = [cap.get(3), cap.get(4)]
     max_dis = 200
     fps = int(cap.get(5))
     t = int(1000/fps)
+    clock = FrameClock(arg.initial_time, t)
+    # window [start, end] in seconds from the clip start, processing begins preroll earlier
+    # so that tracks and matches are warm when output starts
+    stamp_start = clock.stamp0 + int(arg.start * 1000)
+    stamp_end = clock.stamp0 + int(arg.end * 1000) if arg.end > 0 else None
+    if arg.start > 0:
+        # decodes from the keyframe before the target, the position read back is the frame actually reached
+        cap.set(cv2.CAP_PROP_POS_MSEC, max(arg.start - arg.preroll, 0) * 1000)
+        clock.seek(cap.get(cv2.CAP_PROP_POS_FRAMES) * t)
     
-    AIS = AISPRO(arg.ais_path, ais_file, im_shape, t)
+    archive = AISArchive.open(arg.ais_path, arg.ais_archive) if arg.ais_archive else None
+    # one index can be handed to the AISPRO of every camera watching the same feed
+    index = AISIndex(arg.ais_index) if arg.ais_index > 0 else None
+    AIS = AISPRO(arg.ais_path, ais_file, im_shape, t, archive, arg.geometry, index)
+    if arg.prefetch and index is None:
+        AIS.start_prefetch(camera_para, clock.Time_name[:-4], arg.prefetch)
     VIS = VISPRO(arg.anti, arg.anti_rate, t)
-    FUS = FUSPRO(max_dis, im_shape, t)
-    DRA = DRAW(im_shape, t)
+    FUS = FUSPRO(max_dis, im_shape, t, arg.fus_rate, arg.fus_len)
+    DRA = DRAW(im_shape, t, arg.geometry)
+    lut = CameraModel.get(camera_para, im_shape, arg.geometry).pixel_lut() if arg.vis_geo else None
+    if arg.vis_geo and os.path.exists(arg.vis_geo):
+        os.remove(arg.vis_geo)
     
     name = 'demo'
     show_size = 500
@@ -50,7 +69,6 @@ def main(arg):
     bin_inf = pd.DataFrame(columns=['ID', 'mmsi', 'timestamp', 'match'])
 
     print('Start Time: %s || Stamp: %d || fps: %d' % (time0, timestamp0, fps))
-    times = 0
     time_i = 0
     sum_t = []
 
@@ -60,7 +78,10 @@ def main(arg):
             break
         start = time.time()
         
-        Time, timestamp, Time_name = update_time(Time, t)
+        timestamp = clock.tick(cap.get(cv2.CAP_PROP_POS_MSEC) if arg.clock == 'pts' else None)
+        Time_name = clock.Time_name
+        if stamp_end is not None and timestamp > stamp_end:
+            break
         
         AIS_vis, AIS_cur = AIS.process(camera_para, timestamp, Time_name)
         Vis_tra, Vis_cur = VIS.feedCap(im, timestamp, AIS_vis, bin_inf)
@@ -68,9 +89,16 @@ def main(arg):
 
         end = time.time() - start
         time_i = time_i + end
+        if timestamp < stamp_start:
+            # pre-roll, no output
+            time_i = 0
+            continue
         if timestamp % 1000 < t:
+            # seconds since the initial time, so windows share the full run's frame numbers
+            times = timestamp // 1000 - clock.stamp0 // 1000 - 1
             gen_result(times, Vis_cur, Fus_tra, arg.result_metric, im_shape)
-            times = times+1
+            if lut is not None:
+                gen_geo(times, VIS.geo_positions(Vis_cur, lut), arg.vis_geo)
             sum_t.append(time_i)
             print('Time: %s || Stamp: %d || Process: %.6f || Average: %.6f +- %.6f'%(Time_name, timestamp, time_i, np.mean(sum_t), np.std(sum_t)))
             time_i = 0
@@ -94,8 +122,10 @@ def main(arg):
         except cv2.error:
             # Window might be closed externally
             break   
+    AIS.stop_prefetch()
     cap.release()
-    videoWriter.release()
+    if videoWriter is not None:
+        videoWriter.release()
     cv2.destroyAllWindows()
     
     # Performance monitoring durdur
@@ -111,6 +141,16 @@ if __name__ == '__main__':
     parser.add_argument("--anti", type=int, default = 1, help='anti-occlusion True/1|False/0')
     parser.add_argument("--anti_rate", type=int, default = 0, help='occlusion rate 0-1')
     parser.add_argument("--monitor", action='store_true', help='enable performance monitoring') ##
+    parser.add_argument("--geometry", type=str, default = 'geodesic', choices=['geodesic', 'enu'], help='AIS range/bearing model, enu is a closed-form local tangent plane')
+    parser.add_argument("--clock", type=str, default = 'frame', choices=['frame', 'pts'], help='frame timestamps from fixed 1000/fps steps or from the container PTS')
+    parser.add_argument("--start", type=float, default = 0, help='window start [s] from the clip start')
+    parser.add_argument("--end", type=float, default = 0, help='window end [s] from the clip start, 0 runs to the end')
+    parser.add_argument("--preroll", type=float, default = 5, help='seconds processed before --start to warm up tracking and fusion')
+    parser.add_argument("--fus_rate", type=float, default = 1.0, help='AIS trajectory resampling rate for fusion [Hz]')
+    parser.add_argument("--fus_len", type=int, default = 121, help='AIS trajectory points compared in fusion')
+    parser.add_argument("--vis_geo", type=str, default = '', help='csv of the visual tracks\' water plane lon/lat per second, empty to skip')
+    parser.add_argument("--prefetch", type=int, default = 0, help='number of AIS seconds loaded ahead on a worker thread, 0 disables')
+    parser.add_argument("--ais_index", type=int, default = 0, help='grid cell [m] of a shared AIS spatial index, 0 reads AIS per camera')
     parser.add_argument("--data_path", type=str, default = './clip-01/', help='data path')
     parser.add_argument("--result_path", type=str, default = './result/', help='result path')
     
@@ -118,6 +158,7 @@ if __name__ == '__main__':
 
     parser.add_argument("--video_path", type=str, default = video_path, help='video path')
     parser.add_argument("--ais_path", type=str, default = ais_path, help='ais path')
+    parser.add_argument("--ais_archive", type=str, default = '', help='columnar ais archive path, built from ais path if missing')
     parser.add_argument("--result_video", type=str, default = result_video, help='result video')
     parser.add_argument("--result_metric", type=str, default = result_metric, help='result metric')
     parser.add_argument("--initial_time", type=list, default = initial_time, help='initial time')
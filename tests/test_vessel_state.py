@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from utils.AIS_utils import AISPRO
+from utils.schema import AIS
+from utils.vessel_state import VesselTable
+
+def reports(timestamp):
+    # second vessel reports no heading, third no ship type
+    return pd.DataFrame({'mmsi': [413000001, 413000002, 413000003], 'lon': [114.30, 114.31, 114.32],
+                         'lat': [30.60, 30.61, 30.62], 'speed': [5.0, 6.0, 7.0], 'course': [90.0, 180.0, 270.0],
+                         'heading': [90, np.nan, 270], 'type': [70, 60, np.nan], 'timestamp': timestamp})
+
+def test_to_frame_keeps_blank_heading_and_type():
+
+    table = VesselTable(AIS, 'mmsi')
+    table.update(reports(1654344312))
+    df = table.to_frame()
+    assert df['heading'].dtype == np.float64 and df['type'].dtype == np.float64
+    assert df['heading'].isna().tolist() == [False, True, False]
+    assert df['type'].isna().tolist() == [False, False, True]
+
+def test_data_pred_with_blank_heading_and_type():
+
+    aispro = AISPRO('', [], [2560, 1440], 40)
+    for second in range(3):
+        AIS_cur = aispro.data_pred(reports(1654326312000 + second * 1000), (1654344312 + second) * 1000)
+    assert len(AIS_cur) == 3
+    assert AIS_cur.set_index('mmsi')['type'].isna().tolist() == [False, False, True]
@@ -1,38 +1,43 @@
 ﻿import pandas as pd
-from geopy.distance import geodesic
-import pyproj
-from math import radians, cos, sin, tan, atan2, degrees
-import math
+import numpy as np
+import queue, threading
+from datetime import datetime, timedelta
+from utils.traj_store import TrajStore
+from utils.camera import CameraModel, GEOD
+from utils.ais_index import feed_mask
+from utils.schema import AIS, AIS_VIS, empty_frame
+from utils.vessel_state import VesselTable
 
 class AISPRO(object):
-    def __init__(self, ais_path, ais_file, im_shape, t):
+    def __init__(self, ais_path, ais_file, im_shape, t, archive=None, geometry='geodesic', index=None):
         
         self.ais_path = ais_path
         self.ais_file = ais_file
+        self.archive  = archive
+        self.index    = index
+        self.geometry = geometry
+        self.prefetcher = None
         self.im_shape = im_shape
         self.max_dis  = 2*1852
         self.t        = t
         self.time_lim = 2
-        self.AIS_cur  = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','type','timestamp'])
+        self.max_age  = 5 * 60
+        self.states   = VesselTable(AIS, 'mmsi')
+        self.AIS_cur  = empty_frame(AIS)
         # self.AIS_row  = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','time'])
         # self.AIS_pre  = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','time'])
-        self.AIS_vis  = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','type','x','y','timestamp'])
-    
-    def initialization(self):
-        
-        AIS_las = self.AIS_cur
-        AIS_vis = self.AIS_vis
-        AIS_cur = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','type','timestamp'])
-        return AIS_cur, AIS_las, AIS_vis
+        self.AIS_vis  = TrajStore('mmsi', list(AIS_VIS), self.time_lim * 60 + 1)
     
     def read_ais(self, Time_name):
 
+        if self.archive is not None:
+            return self.archive.read(Time_name)
         try:
             path = self.ais_path + '/' + Time_name + '.csv'
             ais_data = pd.read_csv(path, usecols=[1, 2, 3, 4, 5, 6, 7, 8], header=0)
             # self.AIS_row = self.AIS_row.append(ais_data, ignore_index=True)
         except:
-            ais_data = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','type','timestamp'])
+            ais_data = empty_frame(AIS)
         return ais_data
     
     def data_tran(self, AIS_cur, AIS_vis, camera_para, timestamp):
@@ -40,17 +45,43 @@ class AISPRO(object):
         AIS_vis, AIS_vis_cur = self.transform(AIS_cur, AIS_vis, camera_para, self.im_shape)
 
         # self.AIS_pre = self.AIS_pre.append(self.AIS_cur, ignore_index=True)
-        AIS_vis = pd.concat([AIS_vis, AIS_vis_cur], ignore_index=True)
+        AIS_vis.append(AIS_vis_cur)
         
         # self.AIS_pre = self.AIS_pre.drop(self.AIS_pre[self.AIS_pre['time'] < (timestamp // 1000 - self.time_lim * 60)].index)
-        AIS_vis = AIS_vis.drop(AIS_vis[AIS_vis['timestamp'] < (timestamp//1000 - self.time_lim * 60)].index)
+        AIS_vis.evict(timestamp//1000 - self.time_lim * 60)
         return AIS_vis
     
-    def ais_pro(self, AIS_cur, AIS_las, AIS_vis, camera_para, timestamp, Time_name):
+    def load_ais(self, Time_name, camera_para):
+
+        if self.index is not None:
+            # shared with the other cameras, the feed is read once per second
+            self.index.feed(Time_name, self.read_ais)
+            return self.index.query(camera_para, self.im_shape, self.max_dis, geometry=self.geometry)
+        AIS_read = None
+        if self.prefetcher is not None:
+            AIS_read = self.prefetcher.get(Time_name)
+        if AIS_read is None:
+            AIS_read = self.read_ais(Time_name)
+            AIS_read = AIS_read[self.sanity_mask(AIS_read, camera_para, self.max_dis)]
+        return AIS_read
+
+    def start_prefetch(self, camera_para, Time_name, depth):
+
+        self.prefetcher = AISPrefetcher(self, camera_para, Time_name, depth)
+        self.prefetcher.start()
+
+    def stop_prefetch(self):
+
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
+    def ais_pro(self, AIS_vis, camera_para, timestamp, Time_name):
 
-        AIS_read = self.read_ais(Time_name)      
-        AIS_read = self.data_coarse_process(AIS_read, AIS_las,camera_para, self.max_dis)
-        AIS_cur = self.data_pred(AIS_cur, AIS_read, AIS_las, timestamp)
+        # sanity checks are stateless and already applied by load_ais (possibly on the prefetch thread)
+        AIS_read = self.load_ais(Time_name, camera_para)
+        AIS_read = AIS_read[self.jump_mask(AIS_read)]
+        AIS_cur = self.data_pred(AIS_read, timestamp)
         AIS_vis = self.data_tran(AIS_cur, AIS_vis,camera_para, timestamp)
         return AIS_vis, AIS_cur
     
@@ -58,179 +89,128 @@ class AISPRO(object):
         
         if timestamp % 1000 < self.t:
             Time_name = Time_name[:-4]
-            AIS_cur, AIS_las, AIS_vis = self.initialization()
-            self.AIS_vis, self.AIS_cur = self.ais_pro(AIS_cur,AIS_las, AIS_vis, camera_para, timestamp, Time_name)
+            self.AIS_vis, self.AIS_cur = self.ais_pro(self.AIS_vis, camera_para, timestamp, Time_name)
         return self.AIS_vis, self.AIS_cur
     
-    @staticmethod
-    def count_distance(point1, point2, Type='m'):
+    def transform(self, AIS_current, AIS_vis, camera_para, shape):
 
-        distance = geodesic(point1, point2).m
-        if Type == 'nm':
-            distance = distance * 0.00054
-        return distance
+        camera = CameraModel.get(camera_para, shape, self.geometry)
+        D_abs, angle = camera.range_bearing(AIS_current['lon'].to_numpy(dtype=float), AIS_current['lat'].to_numpy(dtype=float))
+        in_view, out_view = camera.in_view(None, None, D_abs, angle)
 
-    @staticmethod
-    def getDegree(latA, lonA, latB, lonB):
-
-        radLatA = radians(latA)
-        radLonA = radians(lonA)
-        radLatB = radians(latB)
-        radLonB = radians(lonB)
-        dLon = radLonB - radLonA
-        y = sin(dLon) * cos(radLatB)
-        x = cos(radLatA) * sin(radLatB) - sin(radLatA) * cos(radLatB) * cos(dLon)
-        brng = degrees(atan2(y, x))
-        brng = (brng + 360) % 360
-        return brng
+        AIS_visCurrent = AIS_current[in_view].reindex(columns=list(AIS_VIS))
+        AIS_visCurrent['x'], AIS_visCurrent['y'] = camera.polar_to_pixel(D_abs[in_view], angle[in_view])
+        AIS_visCurrent = AIS_visCurrent.reset_index(drop=True)
 
-    @staticmethod
-    def visual_transform(lon_v, lat_v, camera_para, shape):
-
-        lon_cam = camera_para[0]
-        lat_cam = camera_para[1]
-        shoot_hdir = camera_para[2]
-        shoot_vdir = camera_para[3]
-        height_cam = camera_para[4]
-        FOV_hor = camera_para[5]
-        FOV_ver = camera_para[6]
-        width_pic = shape[0]
-        height_pic = shape[1]
-        f_x = camera_para[7]
-        f_y = camera_para[8]
-        u0  = camera_para[9]
-        v0  = camera_para[10]
-
-        D_abs = AISPRO.count_distance((lat_cam, lon_cam), (lat_v, lon_v)) 
-        relative_angle = AISPRO.getDegree(lat_cam, lon_cam, lat_v, lon_v)
-        Angle_hor = relative_angle - shoot_hdir
-
-        if Angle_hor < -180:
-            Angle_hor = Angle_hor + 360
-        elif Angle_hor > 180:
-            Angle_hor = Angle_hor - 360
-
-        hor_rad = radians(Angle_hor)
-        shv_rad = radians(-shoot_vdir)
-        Z_w = D_abs*cos(hor_rad)
-        X_w = D_abs*sin(hor_rad)
-        Y_w = height_cam
-        Z = Z_w/cos(shv_rad)+(Y_w-Z_w*tan(shv_rad))*sin(shv_rad)
-        X = X_w
-        Y = (Y_w-Z_w*tan(shv_rad))*cos(shv_rad)
-
-        target_x = int(f_x*X/Z+u0)
-        target_y = int(f_y*Y/Z+v0)
-        
-        #Angle_ver = 90 + shoot_vdir - math.degrees(math.atan(D_abs / height_cam))
-        #target_x1 = int(width_pic // 2 + width_pic * Angle_hor / FOV_hor)
-        #target_y1 = int(height_pic // 2 + height_pic * Angle_ver / FOV_ver)
-
-        return target_x, target_y
-
-    def data_filter(self, ais, camera_para):
-
-        lon_cam = camera_para[0]
-        lat_cam = camera_para[1]
-        shoot_hdir = camera_para[2]
-        shoot_vdir = camera_para[3]
-        height_cam = camera_para[4]
-        FOV_hor = camera_para[5]
-        FOV_ver = camera_para[6]
-
-        lon, lat = ais['lon'], ais['lat']
-        D_abs = self.count_distance((lat_cam,lon_cam),(lat,lon))
-        angle = self.getDegree(lat_cam, lon_cam, lat, lon)
-        in_angle = abs(shoot_hdir - angle) if abs(shoot_hdir - angle) < 180 else 360 - abs(shoot_hdir - angle)
-
-        if 90 + shoot_vdir - FOV_ver / 2 < math.degrees(math.atan(D_abs / height_cam)):
-            
-            if in_angle <= (FOV_hor / 2 + 8):  
-                return 'transform'
-            
-            elif in_angle > (FOV_hor / 2 + 8):
-                return 'visTraj_del'
-            
-            if in_angle > (FOV_hor / 2 + 12):
-                return 'ais_del'
-
-    def transform(self, AIS_current, AIS_vis, camera_para, shape):
-
-        AIS_visCurrent = pd.DataFrame(columns=['mmsi','lon','lat','speed','course','heading','type','x','y','timestamp'])
-        
-        for index, ais in AIS_current.iterrows():
-
-            flag = self.data_filter(ais, camera_para)
-            if flag == 'transform':
-                x, y = self.visual_transform(ais['lon'], ais['lat'], camera_para, shape)
-                ais['x'], ais['y'] = x, y
-                AIS_visCurrent = pd.concat([AIS_visCurrent, ais.to_frame().T], ignore_index=True)
-            
-            elif flag == 'visTraj_del' or flag == 'ais_del':
-                AIS_vis = AIS_vis.drop(AIS_vis[AIS_vis['mmsi'] == ais['mmsi']].index)
+        for mmsi in AIS_current['mmsi'][out_view].astype('int64').tolist():
+            AIS_vis.remove(mmsi)
         return AIS_vis, AIS_visCurrent
 
-    def data_pre(self, ais, timestamp):
+    def data_pre_batch(self, AIS_data, timestamp):
 
-        if ais['speed'] == 0:
-            ais['timestamp'] = timestamp
-        
-        else:
-            geo_d = pyproj.Geod(ellps="WGS84")
-            
-            distance = ais['speed'] * ((timestamp - ais['timestamp']) / 3600) * 1852
-            ais['timestamp'] = timestamp
+        AIS_data = AIS_data.copy()
+        lon = AIS_data['lon'].to_numpy(dtype=float, copy=True)
+        lat = AIS_data['lat'].to_numpy(dtype=float, copy=True)
+        speed = AIS_data['speed'].to_numpy(dtype=float)
+        course = AIS_data['course'].to_numpy(dtype=float)
+        stamp = AIS_data['timestamp'].to_numpy(dtype=float)
 
-            ais['lon'], ais['lat'], c = geo_d.fwd(ais['lon'], ais['lat'], ais['course'], distance)
-        return ais
+        move = (speed != 0) & (stamp != timestamp)
+        if move.any():
+            distance = speed[move] * ((timestamp - stamp[move]) / 3600) * 1852
+            lon[move], lat[move], _ = GEOD.fwd(lon[move], lat[move], course[move], distance)
+            AIS_data['lon'], AIS_data['lat'] = lon, lat
+        AIS_data['timestamp'] = timestamp
+        return AIS_data
 
-    def data_pred(self, AIS_cur, AIS_read, AIS_las, timestamp):
+    def data_pred(self, AIS_read, timestamp):
 
         # Time offset correction - AIS data is ~5 hours behind video
         TIME_OFFSET = 5 * 3600 * 1000  # 5 hours in milliseconds
 
-        for index, ais in AIS_read.iterrows():
-            # Apply time offset to AIS timestamp
-            ais['timestamp'] = ais['timestamp'] + TIME_OFFSET
-            ais['timestamp'] = round(ais['timestamp']/1000)
-            
-            if ais['timestamp'] == int(timestamp//1000):
-                AIS_cur = pd.concat([AIS_cur, ais.to_frame().T], ignore_index=True)
-            
-            else:
-                predicted_data = self.data_pre(ais, timestamp//1000)
-                AIS_cur = pd.concat([AIS_cur, predicted_data.to_frame().T], ignore_index=True)
-        
-        for index, ais in AIS_las.iterrows():
-            if ais['mmsi'] not in AIS_cur['mmsi'].values:
-                predicted_data = self.data_pre(ais, timestamp//1000)
-                AIS_cur = pd.concat([AIS_cur, predicted_data.to_frame().T], ignore_index=True)
+        AIS_read = AIS_read.copy()
+        AIS_read['timestamp'] = np.round((AIS_read['timestamp'].to_numpy(dtype=float) + TIME_OFFSET) / 1000)
+        # reports are aged on the frame clock, the TIME_OFFSET correction is only approximate
+        self.states.update(AIS_read, timestamp//1000)
+
+        # vessels not reported this second are carried over from their last state,
+        # those silent for max_age seconds are dropped
+        self.states.evict(timestamp//1000 - self.max_age)
+        AIS_cur = self.data_pre_batch(self.states.to_frame(), timestamp//1000)
+        self.states.assign(AIS_cur)
         return AIS_cur
 
-    def data_coarse_process(self, AIS_current,AIS_last,camera_para,max_dis):
+    def sanity_mask(self, AIS_current, camera_para, max_dis):
 
-        camera_loc = (camera_para[1], camera_para[0])
-        
-        for index, ais in AIS_current.iterrows():
-            flag = 0
-            
-            if ais['mmsi'] / 100000000 < 1 or ais['mmsi'] / 100000000 >= 10 or\
-                ais['lon'] == -1 or ais['lat'] == -1 or ais['speed'] == -1 or\
-                    ais['course'] == -1 or ais['course'] == 360 or ais['heading'] == -1 or ais['lon'] > 180 or\
-                        ais['lon'] < 0 or ais['lat'] > 90 or ais['lat'] < 0 or ais['speed'] <= 0.3:
-                AIS_current = AIS_current.drop(index=index)
-                continue
-
-            if ais['mmsi'] in AIS_last['mmsi'].values:
-                temp = AIS_last[AIS_last.mmsi == ais['mmsi']]
-                if abs(ais['lon'] - temp['lon'].values[-1]) >= 1 \
-                    or abs(ais['lat'] - temp['lat'].values[-1]) >= 1 \
-                        or abs(ais['speed'] - temp['speed'].values[-1]) >= 7:
-                    AIS_current = AIS_current.drop(index=index)
+        lon = AIS_current['lon'].to_numpy(dtype=float)
+        lat = AIS_current['lat'].to_numpy(dtype=float)
+        dis, _ = CameraModel.get(camera_para, self.im_shape, self.geometry).range_bearing(lon, lat)
+        return feed_mask(AIS_current) & ~(dis > max_dis)
+
+    def jump_mask(self, AIS_current):
+
+        # last known state of each reported vessel, NaN (never a jump) for new ones
+        prev = self.states.states(AIS_current['mmsi'].to_numpy(dtype=np.int64).tolist(), ['lon', 'lat', 'speed'])
+
+        jump = (np.abs(AIS_current['lon'].to_numpy(dtype=float) - prev[:, 0]) >= 1) |\
+            (np.abs(AIS_current['lat'].to_numpy(dtype=float) - prev[:, 1]) >= 1) |\
+                (np.abs(AIS_current['speed'].to_numpy(dtype=float) - prev[:, 2]) >= 7)
+        return ~jump
+
+class AISPrefetcher(object):
+    def __init__(self, aispro, camera_para, Time_name, depth, timeout=1.0):
+
+        self.aispro = aispro
+        self.camera_para = camera_para
+        self.Time_name = Time_name
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=depth)
+        self.pending = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @staticmethod
+    def next_name(Time_name):
+
+        Time = datetime.strptime(Time_name, "%Y_%m_%d_%H_%M_%S") + timedelta(seconds=1)
+        return Time.strftime("%Y_%m_%d_%H_%M_%S")
+
+    def run(self):
+
+        Time_name = self.Time_name
+        while not self.stop_event.is_set():
+            AIS_read = self.aispro.read_ais(Time_name)
+            AIS_read = AIS_read[self.aispro.sanity_mask(AIS_read, self.camera_para, self.aispro.max_dis)]
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put((Time_name, AIS_read), timeout=self.timeout)
+                    break
+                except queue.Full:
                     continue
-    
-            ship_loc = (ais['lat'], ais['lon'])
-            dis = self.count_distance(camera_loc, ship_loc, Type='m')
-            if dis > max_dis or self.data_filter(ais, camera_para) == 'ais_del':
-                AIS_current = AIS_current.drop(index=index)
-        return AIS_current
\ No newline at end of file
+            Time_name = self.next_name(Time_name)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+
+        self.stop_event.set()
+        self.thread.join()
+
+    def get(self, Time_name):
+        """
+        Prefetched AIS for Time_name, or None when the worker has no matching key
+        ready; never waits, the caller falls back to a synchronous read.
+        """
+        while True:
+            if self.pending is None:
+                try:
+                    self.pending = self.queue.get_nowait()
+                except queue.Empty:
+                    return None
+            key, AIS_read = self.pending
+            if key > Time_name:
+                return None
+            self.pending = None
+            if key == Time_name:
+                return AIS_read
@@ -4,6 +4,8 @@ from scipy.spatial.distance import euclidean
 import math
 import numpy as np
 from scipy.optimize import linear_sum_assignment as linear_assignment
+from utils.schema import MAT, MAT_LIST, BIN, RecordBatch, empty_frame
+from utils.traj_store import TrajResampler
 
 def __reduce_by_half(x):
     return [(x[i] + x[1+i]) / 2 for i in range(0, len(x) - len(x) % 2, 2)]
@@ -47,69 +49,71 @@ def DTW_fast(traj0, traj1):
     
     return d*math.exp(theta)
 
-def traj_group(df_data, df_dataCur,  kind):
+def traj_group(df_data, df_dataCur,  kind, resampler=None):
     trajData_list = []  
     trajLabel_list = []  
     trajInf_list = []  
     
     if kind == 'AIS':
-        grouped = df_data.groupby('mmsi')
-        for value, group in grouped:
+        # df_data is the AIS TrajStore, histories are read as per-mmsi views
+        cur_list = set(df_dataCur['mmsi'].astype('int64').tolist())
+        for value in sorted(df_data.keys()):
             
-            if value in df_dataCur['mmsi'].tolist():
-                traj = group.values
+            if value in cur_list:
+                traj = df_data.get(value)
                 
-                trajData_list.append(np.array(traj[:, 7:9]))
-                trajLabel_list.append(int(traj[0, 0]))
+                # fixed rate and length pixel trajectory when a resampler is given
+                trajData_list.append(traj[:, 7:9] if resampler is None else resampler.get(df_data, value))
+                trajLabel_list.append(int(value))
                 trajInf_list.append(traj)
     
     elif kind == 'VIS':
-        grouped = df_data.groupby('ID')
-        for value, group in grouped:
+        # df_data is the visual TrajStore, histories are read as per-ID views
+        cur_list = set(df_dataCur['ID'].astype('int64').tolist())
+        for value in sorted(df_data.keys()):
             
-            if value in df_dataCur['ID'].tolist():
-                traj = group.values
+            if value in cur_list:
+                traj = df_data.get(value)
                 
-                trajData_list.append(np.array(traj[:, 5:7]))
-                trajLabel_list.append(int(traj[0][0]))
+                trajData_list.append(traj[:, 5:7])
+                trajLabel_list.append(int(value))
                 trajInf_list.append(traj)
 
     return trajData_list, trajLabel_list, trajInf_list
 
 class FUSPRO(object):
-    def __init__(self, max_dis, im_shape, t):
+    def __init__(self, max_dis, im_shape, t, rate=1.0, length=121):
         
         self.max_dis = max_dis
         self.im_shape = im_shape
         self.bin_num = 1
         self.fog_num = 2
         self.t = t
-        self.mat_cur  = pd.DataFrame(pd.DataFrame(columns=['ID/mmsi','timestamp', 'match']))
-        self.mat_list = pd.DataFrame(columns=['ID', 'mmsi', 'lon', 'lat', 'speed', 'course', 'heading', 'type', 'timestamp'])
-        self.bin_cur  = pd.DataFrame(columns=['ID', 'mmsi', 'timestamp', 'match'])
+        self.mat_cur  = empty_frame(MAT)
+        self.mat_list = empty_frame(MAT_LIST)
+        self.bin_cur  = empty_frame(BIN)
+        self.resampler = TrajResampler(('x', 'y'), rate, length)
 
     def initialization(self, AIS_list, VIS_list):
         
         mat_las   = self.mat_cur
         bin_las   = mat_las[mat_las['match'] > self.bin_num]
-        mat_cur   = pd.DataFrame(pd.DataFrame(columns=['ID/mmsi','timestamp', 'match']))
-        bin_cur   = pd.DataFrame(columns=['ID', 'mmsi', 'timestamp', 'match'])
-        mat_list  = pd.DataFrame(columns=['ID', 'mmsi', 'lon', 'lat', 'speed', 'course', 'heading', 'type', 'x1', 'y1', 'w', 'h', 'timestamp'])
+        mat_cur   = RecordBatch(MAT)
+        bin_cur   = RecordBatch(BIN)
+        mat_list  = RecordBatch(MAT_LIST)
         
         return mat_cur, bin_cur, mat_las, bin_las, mat_list
     
     def cal_similarity(self, AIS_list, AIS_MMSIlist, VIS_list, VIS_IDlist, bin_las):
         
         matrix_S = np.zeros((len(VIS_list), len(AIS_list)))
-        binIDmmsi, bin_MMSI, bin_ID = [], [], []
-
-        if len(bin_las)!=0:
-            grouped = bin_las.groupby('ID/mmsi')
-            for value, group in grouped:
-                ID, MMSI = value.split('/')
-                bin_ID.append(int(ID))
-                bin_MMSI.append(int(MMSI))
-                binIDmmsi.append(value)
+        binIDmmsi, bin_MMSI, bin_ID = {}, set(), set()
+
+        for value, match in zip(bin_las['ID/mmsi'].tolist(), bin_las['match'].tolist()):
+            ID, MMSI = value.split('/')
+            bin_ID.add(int(ID))
+            bin_MMSI.add(int(MMSI))
+            binIDmmsi.setdefault(value, match)
                 
         for i in range(len(VIS_list)):
             for j in range(len(AIS_list)):
@@ -132,7 +136,7 @@ class FUSPRO(object):
                         matrix_S[i][j] = 1000000000
                 
                 elif cur_IDmmsi in binIDmmsi:
-                    matrix_S[i][j] = 0-int(bin_las[bin_las['ID/mmsi'] == cur_IDmmsi]['match'].values)*100
+                    matrix_S[i][j] = 0-int(binIDmmsi[cur_IDmmsi])*100
                 
                 else:
                     matrix_S[i][j] = 1000000000
@@ -159,6 +163,11 @@ class FUSPRO(object):
     def save_data(self, mat_cur, bin_cur, mat_las, bin_las, mat_list,\
                   matches, AIS_MMSIlist, VIS_IDlist, AInf_list, VInf_list, timestamp):
         
+        match_las = {}
+        for ID_MMSI, match in zip(mat_las['ID/mmsi'].tolist(), mat_las['match'].tolist()):
+            match_las.setdefault(ID_MMSI, match)
+        AIS_MMSIset = set(AIS_MMSIlist)
+
         for i in range(len(matches)):
             v_loc, a_loc = matches[i][0],matches[i][1]
             ID           = int(VIS_IDlist[v_loc])
@@ -180,38 +189,30 @@ class FUSPRO(object):
             w            = abs(x2-x1)
             h            = abs(y2-y1)
             
-            new_row = pd.DataFrame([{'ID':ID,'mmsi':MMSI,'lon':lon,'lat':lat,\
+            mat_list.append({'ID':ID,'mmsi':MMSI,'lon':lon,'lat':lat,\
                 'speed':speed,'course': course,'heading':heading,'type':types,'x1':x1,'y1':y1,\
-                    'w':w,'h':h,'timestamp':time}])
-            mat_list = pd.concat([mat_list, new_row], ignore_index=True)
+                    'w':w,'h':h,'timestamp':time})
             
-            if ID_MMSI in mat_las['ID/mmsi'].values:
-                match = mat_las[mat_las['ID/mmsi'] == ID_MMSI]['match'].values[0]+1
-                new_row = pd.DataFrame([{'ID/mmsi':str(ID)+'/'+str(MMSI),\
-                                           'timestamp':time,'match':match}])
-                mat_cur = pd.concat([mat_cur, new_row], ignore_index=True)
+            if ID_MMSI in match_las:
+                mat_cur.append((ID_MMSI, time, match_las[ID_MMSI]+1))
             
             else:  
-                new_row = pd.DataFrame([{'ID/mmsi':str(ID)+'/'+str(MMSI),\
-                                           'timestamp':time,'match':1}])
-                mat_cur = pd.concat([mat_cur, new_row], ignore_index=True)
+                mat_cur.append((ID_MMSI, time, 1))
         
-        for ind, inf in bin_las.iterrows():
-            ID_MMSI = inf['ID/mmsi']
+        mat_keys = set(row[0] for row in mat_cur.rows)
+        for ID_MMSI, time, match in zip(bin_las['ID/mmsi'].tolist(), bin_las['timestamp'].tolist(), bin_las['match'].tolist()):
             ID, MMSI = [int(x) for x in ID_MMSI.split('/')]
-            time    = inf['timestamp']
-            if MMSI in AIS_MMSIlist and ID_MMSI not in mat_cur['ID/mmsi'].values\
+            if MMSI in AIS_MMSIset and ID_MMSI not in mat_keys\
                                                 and timestamp//1000-time < self.fog_num:
-                mat_cur = pd.concat([mat_cur, pd.DataFrame([inf])], ignore_index=True)
+                mat_cur.append((ID_MMSI, time, match))
+                mat_keys.add(ID_MMSI)
         
-        for ind, inf in mat_cur.iterrows():
-            ID, MMSI = [int(x) for x in inf['ID/mmsi'].split('/')]
-            if inf['match'] > self.bin_num:
-                new_row = pd.DataFrame([{'ID': ID, 'mmsi': MMSI,\
-                  'timestamp': int(inf['timestamp']), 'match': int(inf['match'])}])
-                bin_cur = pd.concat([bin_cur, new_row], ignore_index=True)
+        for ID_MMSI, time, match in mat_cur.rows:
+            ID, MMSI = [int(x) for x in ID_MMSI.split('/')]
+            if match > self.bin_num:
+                bin_cur.append((ID, MMSI, int(time), int(match)))
 
-        return mat_list, mat_cur, bin_cur
+        return mat_list.to_frame(), mat_cur.to_frame(), bin_cur.to_frame()
     
     def traj_match(self, AIS_list, AIS_MMSIlist, VIS_list, VIS_IDlist, AInf_list, VInf_list, timestamp):
         
@@ -234,7 +235,8 @@ class FUSPRO(object):
     def fusion(self,AIS_vis, AIS_cur, Vis_tra, Vis_cur, timestamp):
         if timestamp % 1000 < self.t:
             
-            AIS_list, AIS_MMSIlist, AInf_list = traj_group(AIS_vis, AIS_cur, 'AIS')
+            AIS_list, AIS_MMSIlist, AInf_list = traj_group(AIS_vis, AIS_cur, 'AIS', self.resampler)
+            self.resampler.prune(AIS_vis)
             VIS_list, VIS_IDlist, VInf_list = traj_group(Vis_tra, Vis_cur, 'VIS')
 
             self.mat_list, self.mat_cur, self.bin_cur = self.traj_match(AIS_list, AIS_MMSIlist, VIS_list, VIS_IDlist, AInf_list, VInf_list, timestamp)
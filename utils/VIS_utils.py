@@ -2,6 +2,7 @@
 import torch
 from PIL import Image
 import pandas as pd
+import numpy as np
 from detection_yolox.yolo import YOLO
 from deep_sort.utils.parser import get_config
 from deep_sort.deep_sort import DeepSort
@@ -10,6 +11,8 @@ import cv2
 from PIL import Image
 import pandas as pd
 from IPython import embed
+from utils.schema import VIS_TRA, VIS_FEATURE, VIS_GEO, empty_frame, typed
+from utils.traj_store import TrajStore, MeanAccumulator
 
 simplefilter(action='ignore', category=FutureWarning)
 
@@ -25,16 +28,19 @@ class VISPRO(object):
     def __init__(self, anti, val, t):
         self.anti = anti
         self.last5_vis_tra_list = []
-        self.Vis_tra_cur_3      = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y','timestamp'])
-        self.Vis_tra_cur        = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y','timestamp'])
-        self.Vis_tra            = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y','timestamp'])
-        self.VIS_tra_last = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y', 'speed','timestamp'])
+        # per-ID box sums of the tracker outputs since the last update_tra
+        self.track_acc          = MeanAccumulator(['x1', 'y1', 'x2', 'y2', 'x', 'y'])
+        self.Vis_tra_cur        = empty_frame(VIS_TRA)
+        self.time_lim           = 2
+        # per-ID visual trajectories of the last time_lim minutes
+        self.Vis_tra            = TrajStore('ID', list(VIS_FEATURE), self.time_lim * 60 + 1)
+        self.VIS_tra_last = empty_frame(VIS_FEATURE)
         self.OAR_list = []
         self.OAR_ids_list = []
         self.OAR_mmsi_list = []
         self.val = val
         self.t = t
-        self.Anti_occlusion_traj = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y','speed','timestamp'])
+        self.Anti_occlusion_traj = empty_frame(VIS_FEATURE)
 
     def detection(self, image):
         im0 = cv2.cvtColor(image,cv2.COLOR_BGR2RGB)
@@ -68,30 +74,25 @@ class VISPRO(object):
                 if track_id in id_list:
                     x1, y1, x2, y2, _, _ = bboxes_anti_occ[id_list.index(track_id)] 
                 
-                new_row = pd.DataFrame([{'ID':track_id,\
-                    'x1':int(x1),'y1':int(y1),'x2':int(x2),'y2':int(y2),'x':int((x1 + x2) / 2),\
-                        'y':int((y1 + y2) / 2), 'timestamp':timestamp//1000}])
-                self.Vis_tra_cur_3 = pd.concat([self.Vis_tra_cur_3, new_row], ignore_index=True)
+                self.track_acc.add(int(track_id), (int(x1), int(y1), int(x2), int(y2), int((x1 + x2) / 2), int((y1 + y2) / 2)))
 
     def update_tra(self, Vis_tra, timestamp):
-        self.Vis_tra_cur = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y','timestamp'])
-        id_list = self.Vis_tra_cur_3['ID'].unique()
-        for k in range(len(id_list)):
-            id_current = self.Vis_tra_cur_3[self.Vis_tra_cur_3['ID'] == id_list[k]].reset_index(drop=True)
-            
-            df = id_current.mean().astype(int)
-            df['timestamp'] = timestamp // 1000
-            self.Vis_tra_cur = pd.concat([self.Vis_tra_cur, pd.DataFrame([df])], ignore_index=True)
-        self.Vis_tra_cur_3 = pd.DataFrame(columns=['ID','x1','y1','x2','y2','x','y','timestamp'])
+        # per-ID mean box, truncated like the integer boxes it averages
+        ids, boxes = self.track_acc.means()
+        columns = {'ID': ids}
+        for i, column in enumerate(self.track_acc.columns):
+            columns[column] = np.trunc(boxes[:, i]).astype(VIS_TRA[column])
+        columns['timestamp'] = np.full(len(ids), timestamp // 1000, dtype=VIS_TRA['timestamp'])
+        self.Vis_tra_cur = pd.DataFrame(columns, columns=list(VIS_TRA))
+        self.track_acc.reset()
 
         Vis_tra_cur_withfeature = self.motion_features_extraction(self.last5_vis_tra_list, VIS_tra_cur= self.Vis_tra_cur)
-        self.Vis_tra = pd.concat([self.Vis_tra, Vis_tra_cur_withfeature], ignore_index=True)
+        self.Vis_tra.append(Vis_tra_cur_withfeature)
         if len(self.last5_vis_tra_list) > 4:
             self.last5_vis_tra_list.pop(0)
         self.last5_vis_tra_list.append(Vis_tra_cur_withfeature)
         
-        time_limited = 2
-        self.Vis_tra = self.Vis_tra.drop(self.Vis_tra[self.Vis_tra['timestamp'] < (timestamp // 1000 - time_limited * 60)].index)
+        self.Vis_tra.evict(timestamp // 1000 - self.time_lim * 60)
         return Vis_tra_cur_withfeature
 
     def traj_prediction_via_visual(self, last_traj, timestamp, speed):
@@ -113,75 +114,51 @@ class VISPRO(object):
         bboxes_anti_occ = []
         if len(self.OAR_list):
             
-            pop_index_list = []
-            for index in range(len(bboxes)):
-                for OAR in self.OAR_list:
-                    if self.box_whether_in_area(bboxes[index][:4], OAR):
-                        pop_index_list.append(index)
-                        break
-
-            for pop_index in range(len(pop_index_list)):
-                bboxes.pop(pop_index_list[pop_index] - pop_index)
+            # detections centred inside an occlusion area are replaced by predictions
+            if len(bboxes):
+                inside = self.boxes_in_areas(np.array([bbox[:4] for bbox in bboxes], dtype=float), np.array(self.OAR_list, dtype=float))
+                bboxes[:] = [bbox for bbox, drop in zip(bboxes, inside.tolist()) if not drop]
             
-            bind_id_list = list(bind_inf['ID'].unique())
+            # first bound mmsi of every ID
+            bind_mmsi = {}
+            for ID, mmsi in zip(bind_inf['ID'].tolist(), bind_inf['mmsi'].tolist()):
+                bind_mmsi.setdefault(ID, mmsi)
             self.OAR_mmsi_list = []
             OAR_ids_list_copy = self.OAR_ids_list.copy()
 
             for k in range(len(OAR_ids_list_copy)):
-                if OAR_ids_list_copy[k] in bind_id_list:
-                    mmsi = bind_inf.iloc[bind_id_list.index(OAR_ids_list_copy[k])].loc['mmsi']
+                if OAR_ids_list_copy[k] in bind_mmsi:
+                    mmsi = bind_mmsi[OAR_ids_list_copy[k]]
                     self.OAR_mmsi_list.append([OAR_ids_list_copy[k], int(mmsi)])
                 else:
                     self.OAR_mmsi_list.append([OAR_ids_list_copy[k], 0])
 
-            ais_vis_mmsi_list = list(AIS_vis['mmsi'])
             pop_index_list = []
+            # IDs of every history frame, and row of each ID in the oldest one
+            last5_ids = [set(traj['ID'].tolist()) for traj in last5_vis_tra_list]
+            oldest_row = {ID: i for i, ID in enumerate(last5_vis_tra_list[0]['ID'].tolist())} if last5_vis_tra_list else {}
 
             for k in range(len(self.OAR_mmsi_list)):
-                final_find_flg = 0 
-                second_final_find_flg = 0 
-                final_pos = [] 
-                second_final_pos = [] 
-                
-                if not self.OAR_mmsi_list[k][1] == 0 and self.OAR_mmsi_list[k][1] in ais_vis_mmsi_list:
-                    for i in range(len(ais_vis_mmsi_list)):
-                        
-                        if int(AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['mmsi']) == self.OAR_mmsi_list[k][1] and \
-                            int(AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['timestamp']) == timestamp - 1:
-                            
-                            final_find_flg = 1
-                            final_pos = [AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['x'], AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['y']]
-                            continue
+                mmsi = self.OAR_mmsi_list[k][1]
+                if not mmsi == 0 and mmsi in AIS_vis:
+                    # pixel motion of the bound vessel over the last two seconds of its AIS track
+                    final_pos, second_final_pos = AIS_vis.at(mmsi, [timestamp - 1, timestamp - 2], ['x', 'y'])
+                    if not (np.isnan(final_pos).any() or np.isnan(second_final_pos).any()):
+                        x_motion = final_pos[0] - second_final_pos[0]
+                        y_motion = final_pos[1] - second_final_pos[1]
                         
-                        elif int(AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['mmsi']) == self.OAR_mmsi_list[k][1] and \
-                            int(AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['timestamp']) == timestamp - 2:
-
-                            second_final_find_flg = 1
-                            second_final_pos = [AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['x'], AIS_vis.iloc[len(ais_vis_mmsi_list) - i - 1].loc['y']]
-                            continue
-                        
-                        if final_find_flg and second_final_find_flg:
-                            x_motion = final_pos[0] - second_final_pos[0]
-                            y_motion = final_pos[1] - second_final_pos[1]
-                            
-                            bboxes_anti_occ.append((self.Anti_occlusion_traj.iloc[k].loc['x1'] + x_motion, self.Anti_occlusion_traj.iloc[k].loc['y1'] + y_motion,
-                                 self.Anti_occlusion_traj.iloc[k].loc['x2'] + x_motion, self.Anti_occlusion_traj.iloc[k].loc['y2'] + y_motion, 'vessel', 1))  
-                            break
-                else:
-                    if not self.id_whether_stable(self.OAR_mmsi_list[k][0], last5_vis_tra_list):
-                        pop_index_list.append(k)
+                        bboxes_anti_occ.append((self.Anti_occlusion_traj.iloc[k].loc['x1'] + x_motion, self.Anti_occlusion_traj.iloc[k].loc['y1'] + y_motion,
+                             self.Anti_occlusion_traj.iloc[k].loc['x2'] + x_motion, self.Anti_occlusion_traj.iloc[k].loc['y2'] + y_motion, 'vessel', 1))  
                         continue
-                    index = list(last5_vis_tra_list[0]['ID'].unique()).index(self.OAR_mmsi_list[k][0])
-                    
-                    speed_str = last5_vis_tra_list[0].iloc[index].loc['speed']
-                    speed = [float(speed_str[1:-1].split(',')[0]), float(speed_str[1:-1].split(',')[1])]
-                    
-                    trajs = last5_vis_tra_list[0]
-                    id_list = list(trajs['ID'].unique())
-                    last_traj = trajs.iloc[id_list.index(self.OAR_mmsi_list[k][0])]
-                    Vis_traj_now = self.traj_prediction_via_visual(last_traj, timestamp, speed)
-                    
-                    bboxes_anti_occ.append((Vis_traj_now.loc['x1'], Vis_traj_now.loc['y1'], Vis_traj_now.loc['x2'], Vis_traj_now.loc['y2'], 'vessel', 1))
+                # no AIS track to follow, predict from the visual track
+                if not self.id_whether_stable(self.OAR_mmsi_list[k][0], last5_ids):
+                    pop_index_list.append(k)
+                    continue
+                last_traj = last5_vis_tra_list[0].iloc[oldest_row[self.OAR_mmsi_list[k][0]]]
+                speed = [last_traj.loc['vx'], last_traj.loc['vy']]
+                Vis_traj_now = self.traj_prediction_via_visual(last_traj, timestamp, speed)
+                
+                bboxes_anti_occ.append((Vis_traj_now.loc['x1'], Vis_traj_now.loc['y1'], Vis_traj_now.loc['x2'], Vis_traj_now.loc['y2'], 'vessel', 1))
 
             for i in range(len(pop_index_list)):
                 self.OAR_mmsi_list.pop(pop_index_list[i] - i)
@@ -207,29 +184,29 @@ class VISPRO(object):
                     self.OAR_list, self.OAR_ids_list = self.OAR_extractor(self.last5_vis_tra_list, self.val)
 
                 self.VIS_tra_last = Vis_tra_cur
-                self.Anti_occlusion_traj = pd.DataFrame(columns=['ID', 'x1', 'y1', 'x2', 'y2', 'x', 'y', 'speed', 'timestamp'])
                 id_list = list(self.VIS_tra_last['ID'].unique())
-                for i in self.OAR_ids_list:
-                    row_to_add = self.VIS_tra_last.iloc[id_list.index(i)]
-                    self.Anti_occlusion_traj = pd.concat([self.Anti_occlusion_traj, pd.DataFrame([row_to_add])], ignore_index=True)
+                rows = [id_list.index(i) for i in self.OAR_ids_list]
+                self.Anti_occlusion_traj = self.VIS_tra_last.iloc[rows].reset_index(drop=True)
         return self.Vis_tra, self.Vis_tra_cur
 
-    def box_whether_in_area(self, bounding_box, Area):
-        x_center = (bounding_box[0] + bounding_box[2]) / 2
-        y_center = (bounding_box[1] + bounding_box[3]) / 2
-        Area = [1] + Area 
-        
-        return self.whether_in_area((x_center, y_center), Area)
-
-    def speed_extract(self, last_traj, now_traj):
-        last_x = int(last_traj.loc['x'])
-        last_y = int(last_traj.loc['y'])
-        cur_x = int(now_traj.loc['x'])
-        cur_y = int(now_traj.loc['y'])
-        x_speed = (cur_x - last_x) / (int(now_traj.loc['timestamp']) - int(last_traj.loc['timestamp']))
-        y_speed = (cur_y - last_y) / (int(now_traj.loc['timestamp']) - int(last_traj.loc['timestamp']))
-
-        return [x_speed, y_speed]
+    def geo_positions(self, Vis_cur, lut):
+        """Water plane lon/lat and range of the tracks' waterline points (bottom centre of the box)."""
+        if len(Vis_cur) == 0:
+            return empty_frame(VIS_GEO)
+        u, v = Vis_cur['x'].to_numpy(), Vis_cur['y2'].to_numpy()
+        lon, lat = lut.lonlat(u, v)
+        east, north = lut.ground(u, v)
+        return typed(pd.DataFrame({'ID': Vis_cur['ID'].to_numpy(), 'lon': lon, 'lat': lat,
+                                   'range': np.hypot(east, north), 'timestamp': Vis_cur['timestamp'].to_numpy()}), VIS_GEO)
+
+    def boxes_in_areas(self, boxes, areas):
+        """Mask of the boxes [x1, y1, x2, y2] whose centre lies in any of the areas (edges included)."""
+        if not len(areas):
+            return np.zeros(len(boxes), dtype=bool)
+        x_center = ((boxes[:, 0] + boxes[:, 2]) / 2)[:, None]
+        y_center = ((boxes[:, 1] + boxes[:, 3]) / 2)[:, None]
+        return ((x_center >= areas[:, 0]) & (x_center <= areas[:, 2]) &
+                (y_center >= areas[:, 1]) & (y_center <= areas[:, 3])).any(axis=1)
 
     def whether_in_area(self, point, bbox):
         """
@@ -241,48 +218,19 @@ class VISPRO(object):
         else:
             return 0
 
-    def overlap(self, box1, box2, val):
-        
-        minx1, miny1, maxx1, maxy1 = box1
-        minx2, miny2, maxx2, maxy2 = box2
-        minx = max(minx1, minx2)
-        miny = max(miny1, miny2)
-        maxx = min(maxx1, maxx2)
-        maxy = min(maxy1, maxy2)
-        if minx > maxx or miny > maxy:
-            return 0
-        else:
-            max_x1 = max(minx1, minx2) 
-            min_x2 = min(maxx1, maxx2) 
-            max_y1 = max(miny1, miny2) 
-            min_y2 = min(maxy1, maxy2)  
-            Cross_area = (min_x2 - max_x1) * (min_y2 - max_y1)
-            box1_area = (maxx1 - minx1) * (maxy1 - miny1)
-            box2_area = (maxx2 - minx2) * (maxy2 - miny2)
-            if Cross_area / box1_area > val or Cross_area / box2_area > val:
-                return 1
-            else:
-                return 0
-    def whether_occlusion(self, bbox, cur_bbox_list, val):
+    def overlap_matrix(self, boxes, val):
         """
-        :param bbox: [id,x1,y1,x2,y2]
-        :param cur_bbox_list: [bbox1, bbox2,...]
-        :param matched_id_list: [id1, id2,...]
-        :return: flag, OAR
+        [n, n] mask of box pairs [x1, y1, x2, y2] whose intersection covers more
+        than val of either box (touching boxes intersect with zero area).
         """
-        occlusion_bbox_list = []
-        occlusion_id_list = []
-        for i in range(len(cur_bbox_list)):
-            
-            flag = self.overlap(bbox[1:], cur_bbox_list[i][1:], val)
-            if flag:
-                if len(occlusion_id_list) == 0:
-                    occlusion_id_list.append(bbox[0])
-                    occlusion_bbox_list.append(bbox[1:])
-                occlusion_bbox_list.append(cur_bbox_list[i][1:])
-                occlusion_id_list.append(cur_bbox_list[i][0])
-                break
-        return occlusion_bbox_list, occlusion_id_list
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        ix1, iy1 = np.maximum(x1[:, None], x1[None, :]), np.maximum(y1[:, None], y1[None, :])
+        ix2, iy2 = np.minimum(x2[:, None], x2[None, :]), np.minimum(y2[:, None], y2[None, :])
+        area = (x2 - x1) * (y2 - y1)
+        cross = (ix2 - ix1) * (iy2 - iy1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covered = (cross / area[:, None] > val) | (cross / area[None, :] > val)
+        return ~((ix1 > ix2) | (iy1 > iy2)) & covered
 
     def whether_in_OAR(self, point, OAR_list):
         flag = 0
@@ -294,55 +242,49 @@ class VISPRO(object):
         return flag
 
     def OAR_extractor(self, his_traj_dataframe_list,val):
-        
-        OAR_list = []
-        OAR_id_list = []
-        
-        if len(his_traj_dataframe_list) == 0:
-            return OAR_list, OAR_id_list
-        
-        his_id_list = his_traj_dataframe_list[-1]['ID'].unique()
-        his_bbox_list = []
-        for i in range(len(his_id_list)):
-            visual_traj = his_traj_dataframe_list[-1].iloc[i]
-            his_bbox_list.append([visual_traj['ID'], visual_traj['x1'], visual_traj['y1'], visual_traj['x2'], visual_traj['y2']])
-        
-        for i in range(len(his_bbox_list)):
-            if i < len(his_bbox_list) - 1:
-                occlusion_boxes, occlusion_ids = self.whether_occlusion(his_bbox_list[i], his_bbox_list[i + 1:], val)
-                for index in range(len(occlusion_boxes)):
-                    if (occlusion_ids[index] not in OAR_id_list) and (occlusion_ids[index] in his_id_list):
-                        OAR_list.append(occlusion_boxes[index])
-                        OAR_id_list.append(occlusion_ids[index])
-        return OAR_list, OAR_id_list
+        """
+        Occlusion areas of the last frame: every box paired with the first later
+        box it overlaps, boxes of the pairs taken in order, each ID once.
+        """
+        if len(his_traj_dataframe_list) == 0 or len(his_traj_dataframe_list[-1]) == 0:
+            return [], []
+
+        traj = his_traj_dataframe_list[-1]
+        ids = traj['ID'].to_numpy()
+        boxes = traj[['x1', 'y1', 'x2', 'y2']].to_numpy(dtype=float)
+
+        hit = np.triu(self.overlap_matrix(boxes, val), k=1)
+        rows = np.flatnonzero(hit.any(axis=1))
+        pairs = np.stack([rows, hit[rows].argmax(axis=1)], axis=1).ravel()
+        _, first = np.unique(ids[pairs], return_index=True)
+        keep = pairs[np.sort(first)]
+        return boxes[keep].tolist(), ids[keep].tolist()
 
     def motion_features_extraction(self, his_traj_dataframe_list, VIS_tra_cur):
-        speed_list = []
+        """
+        VIS_tra_cur with pixel velocity vx, vy [px/s] of every ID, measured from its
+        oldest position in the history frames (0 for IDs without history).
+        """
         VIS_traj_cur_withfeature = VIS_tra_cur.copy()
-        cur_id_list = VIS_tra_cur['ID'].unique()
-        for i in range(len(cur_id_list)):
-            speed_list.append('[0, 0]')
-        VIS_traj_cur_withfeature['speed'] = speed_list
-        for k in range(len(cur_id_list)):
-            if len(his_traj_dataframe_list) == 0:
-                #VIS_tra_cur_withfeature.iloc[k].loc['speed'] = [0, 0]
-                continue
-            id = cur_id_list[k]
-            for i in his_traj_dataframe_list:
-                his_id_list = list(i['ID'].unique())
-                if id not in his_id_list:
-                    #VIS_tra_cur_withfeature.iloc[k].loc['speed'] = [0, 0]
-                    continue
-                else:
-                    index = his_id_list.index(id)
-                    last_traj = i.iloc[index]
-                    VIS_traj_cur_withfeature.loc[k, 'speed'] = str(self.speed_extract(last_traj, VIS_traj_cur_withfeature.iloc[k]))
-                    break
+        vx = np.zeros(len(VIS_tra_cur))
+        vy = np.zeros(len(VIS_tra_cur))
+        if len(his_traj_dataframe_list) and len(VIS_tra_cur):
+            # ID indexed history: the oldest row of every ID over the frames (oldest frame first)
+            history = pd.concat([traj[['ID', 'x', 'y', 'timestamp']] for traj in his_traj_dataframe_list], ignore_index=True)
+            history = history.drop_duplicates('ID', keep='first').set_index('ID')
+            last = history.reindex(VIS_tra_cur['ID'].to_numpy())
+            found = last['timestamp'].notna().to_numpy()
+            dt = VIS_tra_cur['timestamp'].to_numpy(dtype=float)[found] - last['timestamp'].to_numpy(dtype=float)[found]
+            vx[found] = (np.trunc(VIS_tra_cur['x'].to_numpy(dtype=float)[found]) - np.trunc(last['x'].to_numpy(dtype=float)[found])) / dt
+            vy[found] = (np.trunc(VIS_tra_cur['y'].to_numpy(dtype=float)[found]) - np.trunc(last['y'].to_numpy(dtype=float)[found])) / dt
+        VIS_traj_cur_withfeature['vx'] = vx
+        VIS_traj_cur_withfeature['vy'] = vy
         return VIS_traj_cur_withfeature
 
-    def id_whether_stable(self, id, last_5_trajs):
-        for traj in last_5_trajs:
-            if id in list(traj['ID'].unique()):
+    def id_whether_stable(self, id, last_5_ids):
+        # last_5_ids: set of IDs of each history frame
+        for ids in last_5_ids:
+            if id in ids:
                 continue
             else:
                 return False
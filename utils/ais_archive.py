@@ -0,0 +1,122 @@
+import os, glob, argparse
+import numpy as np
+import pandas as pd
+
+from utils.schema import AIS, empty_frame
+
+COLUMNS = list(AIS)
+DTYPES  = AIS
+
+def read_second(file):
+    """One per-second AIS csv file as a typed frame (DTYPES)."""
+    ais_data = pd.read_csv(file, usecols=[1, 2, 3, 4, 5, 6, 7, 8], header=0)
+    return ais_data.astype(DTYPES)
+
+class NpyWriter(object):
+    """1-D .npy file written in appends; the header is rewritten with the final length on close."""
+    HEADER = 128
+
+    def __init__(self, path, dtype):
+
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.f = open(path, 'wb')
+        self.f.write(self.header(0))
+
+    def header(self, rows):
+
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (self.dtype.str, rows)
+        header = header.ljust(self.HEADER - 10 - 1) + '\n'
+        return b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode('latin1')
+
+    def write(self, values):
+
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.f.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self):
+
+        self.f.seek(0)
+        self.f.write(self.header(self.rows))
+        self.f.close()
+
+class ArchiveWriter(object):
+    """
+    Incremental writer of the archive layout: one .npy file per column, rows
+    ordered by Time_name, plus keys.npy / offsets.npy so the rows of a second are
+    offsets[i]:offsets[i+1]. Seconds must be written in Time_name order.
+    """
+    def __init__(self, archive_path):
+
+        os.makedirs(archive_path, exist_ok=True)
+        self.archive_path = archive_path
+        self.columns = {column: NpyWriter(os.path.join(archive_path, column + '.npy'), DTYPES[column]) for column in COLUMNS}
+        self.keys, self.offsets = [], [0]
+
+    def write(self, key, ais_data):
+
+        for column, writer in self.columns.items():
+            writer.write(ais_data[column].to_numpy(dtype=DTYPES[column]))
+        self.keys.append(key)
+        self.offsets.append(self.offsets[-1] + len(ais_data))
+
+    def close(self):
+
+        for writer in self.columns.values():
+            writer.close()
+        np.save(os.path.join(self.archive_path, 'keys.npy'), np.array(self.keys, dtype=str))
+        np.save(os.path.join(self.archive_path, 'offsets.npy'), np.array(self.offsets, dtype=np.int64))
+
+def build_archive(ais_path, archive_path):
+    """Convert a directory of per-second AIS csv files (<Time_name>.csv) into one columnar store."""
+    archive = ArchiveWriter(archive_path)
+    for file in sorted(glob.glob(os.path.join(ais_path, '*.csv'))):
+        archive.write(os.path.splitext(os.path.basename(file))[0], read_second(file))
+    archive.close()
+    return archive_path
+
+class AISArchive(object):
+    def __init__(self, archive_path):
+
+        self.archive_path = archive_path
+        self.columns = {column: np.load(os.path.join(archive_path, column + '.npy'), mmap_mode='r') for column in COLUMNS}
+        self.keys    = np.load(os.path.join(archive_path, 'keys.npy'))
+        self.offsets = np.load(os.path.join(archive_path, 'offsets.npy'))
+        self.index   = {key: i for i, key in enumerate(self.keys.tolist())}
+
+    @classmethod
+    def open(cls, ais_path, archive_path):
+
+        if not os.path.exists(os.path.join(archive_path, 'offsets.npy')):
+            build_archive(ais_path, archive_path)
+        return cls(archive_path)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def slice(self, start, end):
+
+        return pd.DataFrame({column: np.array(values[start:end]) for column, values in self.columns.items()}, columns=COLUMNS)
+
+    def read(self, Time_name):
+
+        i = self.index.get(Time_name)
+        if i is None:
+            return empty_frame(AIS)
+        return self.slice(self.offsets[i], self.offsets[i + 1])
+
+    def query(self, start_name, end_name):
+        """Rows of every second with start_name <= Time_name <= end_name."""
+        i = np.searchsorted(self.keys, start_name, side='left')
+        j = np.searchsorted(self.keys, end_name, side='right')
+        return self.slice(self.offsets[i], self.offsets[j])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Build a columnar AIS archive")
+    parser.add_argument("--ais_path", type=str, default = './clip-01/ais', help='per-second AIS csv directory')
+    parser.add_argument("--archive_path", type=str, default = './clip-01/ais_archive', help='archive output path')
+    arg = parser.parse_args()
+
+    archive = AISArchive(build_archive(arg.ais_path, arg.archive_path))
+    print('Archive: %s || Seconds: %d || Rows: %d' % (arg.archive_path, len(archive), archive.offsets[-1]))
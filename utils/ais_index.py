@@ -0,0 +1,113 @@
+import threading
+import numpy as np
+from math import radians, cos, sin, sqrt
+from utils.camera import CameraModel
+from utils.schema import AIS, empty_frame
+
+def feed_mask(AIS_current):
+    """Camera independent part of AISPRO.sanity_mask (MMSI range and sentinel values)."""
+    mmsi = AIS_current['mmsi'].to_numpy(dtype=float) / 100000000
+    lon = AIS_current['lon'].to_numpy(dtype=float)
+    lat = AIS_current['lat'].to_numpy(dtype=float)
+    speed = AIS_current['speed'].to_numpy(dtype=float)
+    course = AIS_current['course'].to_numpy(dtype=float)
+    heading = AIS_current['heading'].to_numpy(dtype=float)
+
+    bad = (mmsi < 1) | (mmsi >= 10) |\
+        (lon == -1) | (lat == -1) | (speed == -1) |\
+            (course == -1) | (course == 360) | (heading == -1) | (lon > 180) |\
+                (lon < 0) | (lat > 90) | (lat < 0) | (speed <= 0.3)
+    return ~bad
+
+def metres_per_degree(lat):
+
+    f = 1 / 298.257223563
+    e2 = f * (2 - f)
+    w = 1 - e2 * sin(radians(lat))**2
+    return radians(1) * 6378137.0 / sqrt(w) * cos(radians(lat)), radians(1) * 6378137.0 * (1 - e2) / w**1.5
+
+class AISIndex(object):
+    """
+    Uniform lon/lat grid over the latest vessel states of one AIS feed, shared by
+    every camera of the port.
+
+    update() bins the feed once (one argsort per update); a camera query only
+    touches the grid columns covering its range circle, each resolved with two
+    binary searches, and runs the exact range/bearing test on those candidates.
+    feed() loads a key (Time_name) at most once however many cameras ask for it.
+    """
+    def __init__(self, cell=1000, lat_ref=None):
+
+        self.cell    = cell
+        self.lat_ref = lat_ref
+        self.key     = None
+        self.data    = empty_frame(AIS)
+        self.order   = np.zeros(0, dtype=np.int64)
+        self.cells   = np.zeros(0, dtype=np.int64)
+        self.lock    = threading.Lock()
+        if lat_ref is not None:
+            self.set_grid(lat_ref)
+
+    def set_grid(self, lat_ref):
+
+        self.lat_ref = lat_ref
+        m_lon, m_lat = metres_per_degree(lat_ref)
+        self.cell_lon = self.cell / m_lon
+        self.cell_lat = self.cell / m_lat
+
+    def cell_xy(self, lon, lat):
+
+        return np.floor(np.asarray(lon) / self.cell_lon).astype(np.int64), np.floor(np.asarray(lat) / self.cell_lat).astype(np.int64)
+
+    def update(self, AIS_current, key=None):
+        """Replace the indexed states with AIS_current (rows failing feed_mask are dropped)."""
+        AIS_current = AIS_current[feed_mask(AIS_current)].reset_index(drop=True)
+        lon = AIS_current['lon'].to_numpy(dtype=float)
+        lat = AIS_current['lat'].to_numpy(dtype=float)
+        if self.lat_ref is None:
+            self.set_grid(float(np.median(lat)) if len(lat) else 0.0)
+
+        x, y = self.cell_xy(lon, lat)
+        cells = (x << 32) + y
+        order = np.argsort(cells, kind='stable')
+        self.data, self.order, self.cells, self.key = AIS_current, order, cells[order], key
+
+    def feed(self, key, loader):
+        """Index loader(key) unless key is already indexed."""
+        with self.lock:
+            if key != self.key:
+                self.update(loader(key), key)
+
+    def candidates(self, lon, lat, radius):
+        """Row numbers of every state in the grid cells overlapping the circle, in feed order."""
+        if not len(self.cells):
+            return self.order
+        m_lon, m_lat = metres_per_degree(lat)
+        d_lon, d_lat = 1.01 * radius / m_lon, 1.01 * radius / m_lat
+        x0, y0 = self.cell_xy(lon - d_lon, lat - d_lat)
+        x1, y1 = self.cell_xy(lon + d_lon, lat + d_lat)
+        x = np.arange(x0, x1 + 1, dtype=np.int64)
+        start = np.searchsorted(self.cells, (x << 32) + y0, side='left')
+        end = np.searchsorted(self.cells, (x << 32) + y1, side='right')
+        rows = [self.order[s:e] for s, e in zip(start.tolist(), end.tolist()) if e > s]
+        if not rows:
+            return self.order[:0]
+        return np.sort(np.concatenate(rows))
+
+    def query(self, camera_para, shape, radius, sector=None, geometry='geodesic'):
+        """
+        States within radius [m] of the camera, optionally only those whose bearing is
+        within sector [deg] of shoot_hdir. Rows keep their feed order.
+        """
+        camera = CameraModel.get(camera_para, shape, geometry)
+        # feed() from another camera swaps data/order/cells under the same lock
+        with self.lock:
+            rows = self.candidates(camera.lon_cam, camera.lat_cam, radius)
+            AIS_read = self.data.iloc[rows]
+        D_abs, angle = camera.range_bearing(AIS_read['lon'].to_numpy(dtype=float), AIS_read['lat'].to_numpy(dtype=float))
+        keep = ~(D_abs > radius)
+        if sector is not None:
+            in_angle = np.abs(camera.shoot_hdir - angle)
+            in_angle = np.where(in_angle < 180, in_angle, 360 - in_angle)
+            keep &= in_angle <= sector
+        return AIS_read[keep]
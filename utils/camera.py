@@ -0,0 +1,261 @@
+import numpy as np
+import pyproj
+from math import radians, cos, sin, atan2, degrees, sqrt, hypot
+
+GEOD = pyproj.Geod(ellps="WGS84")
+GEOMETRY = ['geodesic', 'enu']
+
+def getDegree(latA, lonA, latB, lonB):
+
+    radLatA = radians(latA)
+    radLonA = radians(lonA)
+    radLatB = radians(latB)
+    radLonB = radians(lonB)
+    dLon = radLonB - radLonA
+    y = sin(dLon) * cos(radLatB)
+    x = cos(radLatA) * sin(radLatB) - sin(radLatA) * cos(radLatB) * cos(dLon)
+    brng = degrees(atan2(y, x))
+    brng = (brng + 360) % 360
+    return brng
+
+def bearing(latA, lonA, latB, lonB):
+
+    radLatA = np.radians(latA)
+    radLonA = np.radians(lonA)
+    radLatB = np.radians(latB)
+    radLonB = np.radians(lonB)
+    dLon = radLonB - radLonA
+    y = np.sin(dLon) * np.cos(radLatB)
+    x = np.cos(radLatA) * np.sin(radLatB) - np.sin(radLatA) * np.cos(radLatB) * np.cos(dLon)
+    brng = np.degrees(np.arctan2(y, x))
+    brng = (brng + 360) % 360
+    return brng
+
+class CameraModel(object):
+    """
+    Pinhole model of a fixed camera looking at the water plane, built once from
+    camera_para = [lon, lat, shoot_hdir, shoot_vdir, height, FOV_hor, FOV_ver, f_x, f_y, u0, v0].
+
+    geometry selects how range/bearing to a vessel is computed:
+      'geodesic' - WGS84 geodesic range + spherical bearing (getDegree), the original model
+      'enu'      - closed form on the camera-anchored east/north tangent plane, scaled by the
+                   WGS84 radii of curvature at the camera latitude
+    Against the WGS84 geodesic at 2 nm (max_dis) the 'enu' range error is below 0.25 m at
+    30.6N (clip-01) and 0.7 m at 60N; its bearing is within 0.011 deg (0.03 deg at 60N) of
+    the geodesic azimuth. The spherical bearing of 'geodesic' itself differs from that
+    azimuth by up to 0.14 deg, so on clip-01 the two modes place a vessel up to ~10 px
+    apart horizontally (1 px vertically), with 'enu' the closer one.
+    """
+    cache = {}
+
+    def __init__(self, camera_para, shape, geometry='geodesic'):
+
+        self.camera_para = list(camera_para)
+        self.lon_cam, self.lat_cam = camera_para[0], camera_para[1]
+        self.shoot_hdir = camera_para[2]
+        self.shoot_vdir = camera_para[3]
+        self.height_cam = camera_para[4]
+        self.FOV_hor, self.FOV_ver = camera_para[5], camera_para[6]
+        self.f_x, self.f_y = camera_para[7], camera_para[8]
+        self.u0,  self.v0  = camera_para[9], camera_para[10]
+        self.shape = shape
+        self.geometry = geometry
+        if geometry not in GEOMETRY:
+            raise ValueError('unknown geometry: %s' % geometry)
+
+        # metres per radian of lon/lat on the tangent plane at the camera
+        f = 1 / 298.257223563
+        e2 = f * (2 - f)
+        w = 1 - e2 * sin(radians(self.lat_cam))**2
+        self.k_east  = 6378137.0 / sqrt(w) * cos(radians(self.lat_cam))
+        self.k_north = 6378137.0 * (1 - e2) / w**1.5
+
+        # camera frame is the world frame pitched by shoot_vdir:
+        # Z = Z_w*cos + H*sin, Y = H*cos - Z_w*sin
+        shv_rad = radians(-self.shoot_vdir)
+        self.cos_v, self.sin_v = cos(shv_rad), sin(shv_rad)
+        self.H_cos, self.H_sin = self.height_cam * self.cos_v, self.height_cam * self.sin_v
+        # in_view thresholds: lower edge of the view and half sector (+8 deg margin)
+        self.min_depression = 90 + self.shoot_vdir - self.FOV_ver / 2
+        self.max_in_angle = self.FOV_hor / 2 + 8
+        self.lut = None
+
+    @classmethod
+    def get(cls, camera_para, shape, geometry='geodesic'):
+
+        key = (tuple(camera_para), tuple(shape), geometry)
+        camera = cls.cache.get(key)
+        if camera is None:
+            camera = cls.cache[key] = cls(camera_para, shape, geometry)
+        return camera
+
+    @classmethod
+    def from_file(cls, path, shape, geometry='geodesic'):
+
+        with open(path, "r") as f:
+            camera_para = f.readlines()[0][1:-2]
+            camera_para = list(map(float, camera_para.split(',')))
+        return cls.get(camera_para, shape, geometry)
+
+    def range_bearing(self, lon, lat):
+
+        lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        if self.geometry == 'enu':
+            east  = np.radians(lon - self.lon_cam) * self.k_east
+            north = np.radians(lat - self.lat_cam) * self.k_north
+            return np.hypot(east, north), np.degrees(np.arctan2(east, north)) % 360
+        _, _, D_abs = GEOD.inv(np.full_like(lon, self.lon_cam), np.full_like(lat, self.lat_cam), lon, lat)
+        return D_abs, bearing(self.lat_cam, self.lon_cam, lat, lon)
+
+    def range_bearing_scalar(self, lon, lat):
+
+        if self.geometry == 'enu':
+            east  = radians(lon - self.lon_cam) * self.k_east
+            north = radians(lat - self.lat_cam) * self.k_north
+            return hypot(east, north), degrees(atan2(east, north)) % 360
+        _, _, D_abs = GEOD.inv(self.lon_cam, self.lat_cam, lon, lat)
+        return D_abs, getDegree(self.lat_cam, self.lon_cam, lat, lon)
+
+    def polar_to_subpixel(self, D_abs, relative_angle):
+
+        Angle_hor = (relative_angle - self.shoot_hdir + 180) % 360 - 180
+        hor_rad = np.radians(Angle_hor)
+        Z_w = D_abs*np.cos(hor_rad)
+        X = D_abs*np.sin(hor_rad)
+        Z = Z_w*self.cos_v + self.H_sin
+        Y = self.H_cos - Z_w*self.sin_v
+        return self.f_x*X/Z + self.u0, self.f_y*Y/Z + self.v0
+
+    def polar_to_pixel(self, D_abs, relative_angle):
+
+        target_x, target_y = self.polar_to_subpixel(D_abs, relative_angle)
+        # int() truncates toward zero
+        return np.trunc(target_x).astype(int), np.trunc(target_y).astype(int)
+
+    def project_batch(self, lon, lat):
+
+        D_abs, relative_angle = self.range_bearing(lon, lat)
+        return self.polar_to_pixel(D_abs, relative_angle)
+
+    def project_subpixel(self, lon, lat):
+
+        D_abs, relative_angle = self.range_bearing(lon, lat)
+        return self.polar_to_subpixel(D_abs, relative_angle)
+
+    def project(self, lon, lat):
+
+        D_abs, relative_angle = self.range_bearing_scalar(lon, lat)
+        hor_rad = radians((relative_angle - self.shoot_hdir + 180) % 360 - 180)
+        Z_w = D_abs*cos(hor_rad)
+        X = D_abs*sin(hor_rad)
+        Z = Z_w*self.cos_v + self.H_sin
+        Y = self.H_cos - Z_w*self.sin_v
+        return int(self.f_x*X/Z + self.u0), int(self.f_y*Y/Z + self.v0)
+
+    def in_view(self, lon, lat, D_abs=None, angle=None):
+        """Masks of the vessels below the lower edge of the view, in view and out of the sector."""
+        if D_abs is None:
+            D_abs, angle = self.range_bearing(lon, lat)
+        in_angle = np.abs(self.shoot_hdir - angle)
+        in_angle = np.where(in_angle < 180, in_angle, 360 - in_angle)
+
+        in_range = self.min_depression < np.degrees(np.arctan(D_abs / self.height_cam))
+        in_view = in_range & (in_angle <= self.max_in_angle)
+        out_view = in_range & (in_angle > self.max_in_angle)
+        return in_view, out_view
+
+    def row_distance(self, v):
+        """Forward ground distance Z_w and camera depth Z [m] of image row v (NaN above the horizon)."""
+        r = (np.asarray(v, dtype=float) - self.v0) / self.f_y
+        den = self.sin_v + r*self.cos_v
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Z_w = np.where(den > 0, (self.H_cos - r*self.H_sin) / den, np.nan)
+        return Z_w, Z_w*self.cos_v + self.H_sin
+
+    def pixel_to_polar(self, u, v):
+        """
+        Reverse projection of image points onto the water plane: range [m] and
+        bearing [deg] from the camera. Points on or above the horizon give NaN.
+        """
+        u = np.asarray(u, dtype=float)
+        Z_w, Z = self.row_distance(v)
+        X = (u - self.u0) / self.f_x * Z
+        D_abs = np.hypot(X, Z_w)
+        relative_angle = (self.shoot_hdir + np.degrees(np.arctan2(X, Z_w))) % 360
+        return D_abs, relative_angle
+
+    def back_project(self, u, v):
+        """Waterline pixel -> (lon, lat)."""
+        D_abs, relative_angle = self.pixel_to_polar(u, v)
+        if self.geometry == 'enu':
+            bearing_rad = np.radians(relative_angle)
+            lon = self.lon_cam + np.degrees(D_abs * np.sin(bearing_rad) / self.k_east)
+            lat = self.lat_cam + np.degrees(D_abs * np.cos(bearing_rad) / self.k_north)
+            return lon, lat
+        lon0, lat0 = np.full_like(D_abs, self.lon_cam), np.full_like(D_abs, self.lat_cam)
+        # forward projection measures bearing on the sphere, correct the geodesic azimuth to match it
+        azimuth = relative_angle
+        for _ in range(2):
+            lon, lat, _ = GEOD.fwd(lon0, lat0, azimuth, D_abs)
+            azimuth = azimuth + (relative_angle - bearing(self.lat_cam, self.lon_cam, lat, lon) + 180) % 360 - 180
+        lon, lat, _ = GEOD.fwd(lon0, lat0, azimuth, D_abs)
+        return lon, lat
+
+    def pixel_lut(self):
+        """PixelLUT of the camera, built on first use."""
+        if self.lut is None:
+            self.lut = PixelLUT(self)
+        return self.lut
+
+class PixelLUT(object):
+    """
+    Reverse projection of integer pixels onto the water plane by table lookup.
+
+    For a pitched camera neither range nor bearing depends on a single image
+    axis, but the ground point does factor into a per-row forward distance
+    Z_w(v) and lateral scale Z(v)/f_x, and a per-column offset u - u0:
+        forward = Z_w[v], right = (u - u0) * Z[v] / f_x
+    The rows are stored already rotated by shoot_hdir and scaled to degrees on
+    the camera's east/north tangent plane, so lon/lat of a pixel is two row
+    lookups and a multiply-add, with no per-point trig. Positions are those of
+    back_project with geometry='enu'; rows on or above the horizon give NaN.
+    """
+    def __init__(self, camera):
+
+        width, height = int(camera.shape[0]), int(camera.shape[1])
+        self.width, self.height = width, height
+        self.lon_cam, self.lat_cam = camera.lon_cam, camera.lat_cam
+
+        Z_w, Z = camera.row_distance(np.arange(height))
+        lateral = Z / camera.f_x
+        self.column = np.arange(width) - camera.u0
+
+        hdir = radians(camera.shoot_hdir)
+        to_lon, to_lat = degrees(1) / camera.k_east, degrees(1) / camera.k_north
+        self.east_f, self.north_f = Z_w * sin(hdir), Z_w * cos(hdir)
+        self.east_l, self.north_l = lateral * cos(hdir), -lateral * sin(hdir)
+        self.lon_f, self.lat_f = self.east_f * to_lon, self.north_f * to_lat
+        self.lon_l, self.lat_l = self.east_l * to_lon, self.north_l * to_lat
+
+    def index(self, u, v):
+
+        u = np.clip(np.asarray(u, dtype=float), 0, self.width - 1).astype(np.int64)
+        v = np.clip(np.asarray(v, dtype=float), 0, self.height - 1).astype(np.int64)
+        return u, v
+
+    def ground(self, u, v):
+        """East/north [m] of the pixels' water plane points from the camera."""
+        u, v = self.index(u, v)
+        du = self.column[u]
+        return self.east_f[v] + du*self.east_l[v], self.north_f[v] + du*self.north_l[v]
+
+    def polar(self, u, v):
+        """Range [m] and bearing [deg] of the pixels, as pixel_to_polar."""
+        east, north = self.ground(u, v)
+        return np.hypot(east, north), np.degrees(np.arctan2(east, north)) % 360
+
+    def lonlat(self, u, v):
+        """lon/lat of the pixels, as back_project with geometry='enu'."""
+        u, v = self.index(u, v)
+        du = self.column[u]
+        return self.lon_cam + self.lon_f[v] + du*self.lon_l[v], self.lat_cam + self.lat_f[v] + du*self.lat_l[v]
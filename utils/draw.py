@@ -1,7 +1,7 @@
 ﻿import pandas as pd
 import numpy as np
 import cv2
-from utils.AIS_utils import AISPRO
+from utils.camera import CameraModel, GEOD
 
 def add_alpha_channel(img):
 
@@ -146,8 +146,44 @@ def filter_inf(df_draw, w, h, w0, h0, wn, hn, df):
 
     return df_new
 
+class AISMotion(object):
+    """
+    Pixel motion of the AIS markers between two AIS seconds. At every second tick
+    each vessel of AIS_cur is projected at its position and at its dead-reckoned
+    position one second later; frames in between are placed by linear
+    interpolation, so no geodesic solve runs outside the tick.
+    """
+    def __init__(self):
+
+        self.tick = None
+        self.mmsi = np.zeros(0, dtype=np.int64)
+        self.xy   = np.zeros((0, 2))
+        self.vel  = np.zeros((0, 2))
+
+    def update(self, AIS_cur, camera, timestamp):
+
+        lon = AIS_cur['lon'].to_numpy(dtype=float)
+        lat = AIS_cur['lat'].to_numpy(dtype=float)
+        course = AIS_cur['course'].to_numpy(dtype=float)
+        # knots -> metres travelled in one second
+        step = AIS_cur['speed'].to_numpy(dtype=float) / 3600 * 1852
+        x0, y0 = camera.project_subpixel(lon, lat)
+        lon1, lat1, _ = GEOD.fwd(lon, lat, course, step)
+        x1, y1 = camera.project_subpixel(lon1, lat1)
+
+        # AIS_cur is predicted to the whole second of timestamp
+        self.tick = timestamp - timestamp % 1000
+        self.mmsi = AIS_cur['mmsi'].to_numpy(dtype=float).astype(np.int64)
+        self.xy   = np.stack([x0, y0], axis=1)
+        self.vel  = np.stack([x1 - x0, y1 - y0], axis=1)
+
+    def position(self, timestamp):
+
+        xy = self.xy + self.vel * ((timestamp - self.tick) / 1000)
+        return np.trunc(xy).astype(int)
+
 class DRAW(object):
-    def __init__(self, shape, t):
+    def __init__(self, shape, t, geometry='geodesic'):
         self.df_draw = pd.DataFrame(columns=['ais', 'mmsi', 'sog', 'cog', 'lat', 'lon', 'box_x1', 'box_y1', 'box_x2', 'box_y2', 'inf_x1', 'inf_y1', 'inf_x2', 'inf_y2', 'color'])
         self.w , self.h = int(shape[0]), int(shape[1])
         self.h0, self.w0 = self.h//8, self.w//12
@@ -155,6 +191,8 @@ class DRAW(object):
         self.tl = None or round(0.002 * (shape[0] + shape[1]) / 2) + 1
         self.tf = max(self.tl + 1, 1)  # font thickness
         self.t = t
+        self.geometry = geometry
+        self.motion = AISMotion()
         
     def draw_traj(self, pic, AIS_vis, AIS_cur, Vis_tra, Vis_cur, fusion_list, timestamp, camera_para):
         add_img = pic.copy()
@@ -175,37 +213,32 @@ class DRAW(object):
         #     # Sarı dolu daire ile işaretle
         #     cv2.circle(add_img, (cx, cy), 6, (0, 255, 255), -1)
         
-        for _, ais_row in AIS_cur.iterrows():
-            # AIS_cur'da x,y yok, lon/lat var → visual_transform ile piksele çevir
-            cx, cy = AISPRO.visual_transform(
-                ais_row['lon'],
-                ais_row['lat'],
-                camera_para,   # main() içinde zaten var
-                (self.w, self.h)  # DRAW sınıfında mevcut görüntü boyutu
-            )
+        # AIS_cur saniyede bir değişir → piksel konumu ve hızı saniye başında hesaplanır, aradaki karelerde enterpolasyon
+        if self.motion.tick is None or timestamp % 1000 < self.t or len(self.motion.mmsi) != len(AIS_cur):
+            self.motion.update(AIS_cur, CameraModel.get(camera_para, (self.w, self.h), self.geometry), timestamp)
+        for (cx, cy), mmsi in zip(self.motion.position(timestamp).tolist(), self.motion.mmsi.tolist()):
 
             # Sarı nokta çiz
             cv2.circle(add_img, (cx, cy), 6, (0, 255, 255), -1)
             # MMSI etiketini ekle
-            cv2.putText(add_img, str(int(ais_row['mmsi'])), (cx + 8, cy - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+            cv2.putText(add_img, str(mmsi), (cx + 8, cy - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
 
         if timestamp % 1000 < self.t:
             df_draw = pd.DataFrame(columns=['ais', 'mmsi', 'sog', 'cog', 'lat', 'lon', 'box_x1', 'box_y1', 'box_x2', 'box_y2', 'inf_x1', 'inf_y1', 'inf_x2', 'inf_y2', 'color'])
-            mmsi_list = AIS_vis['mmsi'].unique()
             id_list = Vis_cur['ID'].unique()
             
             for i in range(len(id_list)):
                 
-                id_current = Vis_tra[Vis_tra['ID'] == id_list[i]].reset_index(drop=True)
-                last = len(id_current)-1
-                if last != -1:
-                    x1 = int(max(id_current['x1'][last],0))
-                    y1 = int(max(id_current['y1'][last],0))
-                    x2 = int(min(id_current['x2'][last],self.w))
-                    y2 = int(min(id_current['y2'][last],self.h))
-                    if id_current['timestamp'][last] == timestamp//1000 and len(fusion_list) != 0:
+                # Vis_tra is the visual TrajStore, the ID's latest row is read directly
+                if id_list[i] in Vis_tra:
+                    last = dict(zip(Vis_tra.columns, Vis_tra.last(id_list[i])))
+                    x1 = int(max(last['x1'],0))
+                    y1 = int(max(last['y1'],0))
+                    x2 = int(min(last['x2'],self.w))
+                    y2 = int(min(last['y2'],self.h))
+                    if last['timestamp'] == timestamp//1000 and len(fusion_list) != 0:
                         fusion_current = fusion_list[fusion_list['ID'] == \
-                                id_current['ID'][last]].reset_index(drop=True)
+                                last['ID']].reset_index(drop=True)
                         
                         if len(fusion_current) != 0:
                             df_draw = process_img(df_draw, x1, y1, x2, y2, fusion_current, self.w, self.h, self.w0, self.h0, Type = True)
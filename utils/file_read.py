@@ -1,5 +1,5 @@
 ﻿import os, time, glob, re
-from datetime import datetime
+from datetime import datetime, timedelta
 
 def time2stamp(Time):
     name = "%d_%02d_%02d_%02d_%02d_%02d_%03d"%(Time[0],Time[1],Time[2],Time[3],Time[4],Time[5],Time[6])
@@ -8,19 +8,48 @@ def time2stamp(Time):
     return timeStamp, name
 
 def update_time(Time, t):
-    Time[6] = Time[6] + t
-    if Time[6]>=1000:
-        Time[5] = Time[5] + 1
-        Time[6] = Time[6] - 1000
-        if Time[5]>=60:
-            Time[4] = Time[4] + 1
-            Time[5] = Time[5] - 60
-            if Time[4]>=60:
-                Time[3] = Time[3] + 1
-                Time[4] = Time[4] - 60
+    Time_obj = datetime(*Time[:6], Time[6]*1000) + timedelta(milliseconds=t)
+    Time = [Time_obj.year, Time_obj.month, Time_obj.day, Time_obj.hour, Time_obj.minute, Time_obj.second, Time_obj.microsecond//1000]
     timeStamp, name = time2stamp(Time)
     return Time, timeStamp, name
 
+class FrameClock(object):
+    """
+    Frame clock in integer epoch milliseconds (local time, as time2stamp).
+    tick() advances by t, or follows the container PTS when pos_msec is given
+    (the PTS of the frame just read, offset by t so that frame N gets the same
+    stamp0 + (N+1)*t in both modes);
+    Time_name is formatted on demand and the date part only once per second.
+    """
+    def __init__(self, Time, t):
+
+        self.stamp0, _ = time2stamp(Time)
+        self.stamp  = self.stamp0
+        self.t      = t
+        self.second = None
+        self.prefix = None
+
+    def tick(self, pos_msec=None):
+
+        if pos_msec is None:
+            self.stamp += self.t
+        else:
+            self.stamp = self.stamp0 + int(round(pos_msec)) + self.t
+        return self.stamp
+
+    def seek(self, offset):
+        """Set the clock offset [ms] from the initial time, the next tick() follows it."""
+        self.stamp = self.stamp0 + int(round(offset))
+        return self.stamp
+
+    @property
+    def Time_name(self):
+
+        second = self.stamp // 1000
+        if second != self.second:
+            self.second = second
+            self.prefix = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime(second))
+        return "%s_%03d" % (self.prefix, self.stamp % 1000)
 
 def read_all(path, result_path):
     video_path = glob.glob(path+'*.mp4') + glob.glob(path+'*.avi')
@@ -1,5 +1,12 @@
 ﻿import pandas as pd
 
+def gen_geo(frame, geo, result_name):
+    # visual vessel positions on the water plane: frame, ID, lon, lat, range
+    if len(geo):
+        df = geo[['ID', 'lon', 'lat', 'range']].copy()
+        df.insert(0, 'frame', frame)
+        df.to_csv(result_name, mode='a', index = False, header=False)
+
 def gen_result(frame,vis,fus,result_name,im_shape):
 
     for index, inf in vis.iterrows():
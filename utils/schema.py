@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# Column name -> dtype of the tables passed between AIS, VIS, FUS and DRAW.
+# lon/lat stay float64: float32 has ~1.5 m resolution at these longitudes,
+# which moves projected vessels by whole pixels. Box and track pixel coordinates
+# are float32; projected AIS pixels (AIS_VIS x/y) stay float64 like the lon/lat
+# they come from, since FUS resamples them in time between AIS seconds.
+# heading and type are optional in the feed and float64 so that blanks stay NaN.
+AIS = {'mmsi': np.int64, 'lon': np.float64, 'lat': np.float64, 'speed': np.float64,
+       'course': np.float64, 'heading': np.float64, 'type': np.float64, 'timestamp': np.int64}
+AIS_VIS = {**{k: v for k, v in AIS.items() if k != 'timestamp'}, 'x': np.float64, 'y': np.float64, 'timestamp': np.int64}
+VIS_TRA = {'ID': np.int64, 'x1': np.float32, 'y1': np.float32, 'x2': np.float32, 'y2': np.float32,
+           'x': np.float32, 'y': np.float32, 'timestamp': np.int64}
+VIS_FEATURE = {**VIS_TRA, 'vx': np.float64, 'vy': np.float64}
+MAT = {'ID/mmsi': object, 'timestamp': np.int64, 'match': np.int64}
+MAT_LIST = {'ID': np.int64, 'mmsi': np.int64, 'lon': np.float64, 'lat': np.float64, 'speed': np.float64,
+            'course': np.float64, 'heading': np.float64, 'type': np.float64, 'x1': np.float32, 'y1': np.float32,
+            'w': np.float32, 'h': np.float32, 'timestamp': np.int64}
+BIN = {'ID': np.int64, 'mmsi': np.int64, 'timestamp': np.int64, 'match': np.int64}
+VIS_GEO = {'ID': np.int64, 'lon': np.float64, 'lat': np.float64, 'range': np.float64, 'timestamp': np.int64}
+
+def empty_frame(schema):
+    return pd.DataFrame({column: np.zeros(0, dtype=dtype) for column, dtype in schema.items()})
+
+def typed(df, schema):
+    """df with exactly the schema's columns, in order, cast to the schema's dtypes."""
+    if len(df) == 0:
+        return empty_frame(schema)
+    return df.reindex(columns=list(schema)).astype(schema)
+
+class RecordBatch(object):
+    """
+    Row buffer of one schema. Rows are appended as tuples (schema order) or
+    dicts and turned into typed numpy columns in one step, instead of growing
+    a DataFrame one single-row concat at a time.
+    """
+    def __init__(self, schema):
+
+        self.schema = schema
+        self.columns = list(schema)
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, row):
+
+        if isinstance(row, dict):
+            row = tuple(row[column] for column in self.columns)
+        self.rows.append(row)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def arrays(self):
+
+        if not self.rows:
+            return {column: np.zeros(0, dtype=dtype) for column, dtype in self.schema.items()}
+        values = list(zip(*self.rows))
+        return {column: np.asarray(values[i], dtype=dtype) if dtype is not object else np.array(values[i], dtype=object)
+                for i, (column, dtype) in enumerate(self.schema.items())}
+
+    def to_frame(self):
+        return pd.DataFrame(self.arrays(), columns=self.columns)
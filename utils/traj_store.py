@@ -0,0 +1,208 @@
+import numpy as np
+
+class TrajStore(object):
+    """
+    Per-key trajectory history kept in fixed-capacity ring buffers.
+
+    Every key (mmsi / ID) owns one slot of a shared [slots, 2*capacity, columns]
+    array. Rows are written twice, at p and p+capacity, so the history of a key
+    is always the contiguous, chronological view data[slot, head:head+size].
+    Append, eviction of the oldest rows and deletion of a key are O(1) per row
+    and never copy the stored history.
+    """
+    def __init__(self, key, columns, capacity, time_column='timestamp', slots=64):
+
+        self.key      = key
+        self.columns  = list(columns)
+        self.col      = {column: i for i, column in enumerate(self.columns)}
+        self.capacity = capacity
+        self.time_col = self.col[time_column]
+        self.data     = np.zeros((slots, 2*capacity, len(self.columns)))
+        self.head     = np.zeros(slots, dtype=np.int64)
+        self.size     = np.zeros(slots, dtype=np.int64)
+        self.slot     = {}
+        self.free     = list(range(slots - 1, -1, -1))
+
+    def __len__(self):
+        return int(self.size.sum())
+
+    def __contains__(self, key):
+        return key in self.slot
+
+    def keys(self):
+        return self.slot.keys()
+
+    def grow(self):
+
+        slots = len(self.head)
+        self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+        self.head = np.concatenate([self.head, np.zeros(slots, dtype=np.int64)])
+        self.size = np.concatenate([self.size, np.zeros(slots, dtype=np.int64)])
+        self.free = list(range(2*slots - 1, slots - 1, -1))
+
+    def get_slot(self, key):
+
+        s = self.slot.get(key)
+        if s is None:
+            if not self.free:
+                self.grow()
+            s = self.free.pop()
+            self.slot[key] = s
+            self.head[s], self.size[s] = 0, 0
+        return s
+
+    def append_row(self, key, row):
+
+        s = self.get_slot(key)
+        cap = self.capacity
+        p = (self.head[s] + self.size[s]) % cap
+        self.data[s, p] = row
+        self.data[s, p + cap] = row
+        if self.size[s] < cap:
+            self.size[s] += 1
+        else:
+            self.head[s] = (self.head[s] + 1) % cap
+
+    def append(self, df):
+
+        if len(df) == 0:
+            return
+        rows = df.reindex(columns=self.columns).to_numpy(dtype=float)
+        keys = df[self.key].to_numpy(dtype=np.int64)
+        for key, row in zip(keys.tolist(), rows):
+            self.append_row(key, row)
+
+    def remove(self, key):
+
+        s = self.slot.pop(key, None)
+        if s is not None:
+            self.size[s] = 0
+            self.free.append(s)
+
+    def evict(self, min_time):
+        """Drop every row with time < min_time, and keys left without rows."""
+        for key, s in list(self.slot.items()):
+            h, n = self.head[s], self.size[s]
+            drop = int(np.searchsorted(self.data[s, h:h + n, self.time_col], min_time, side='left'))
+            if drop == n:
+                self.remove(key)
+            elif drop:
+                self.head[s] = (h + drop) % self.capacity
+                self.size[s] = n - drop
+
+    def get(self, key):
+        """Chronological [size, columns] view of a key's history (not a copy)."""
+        s = self.slot[key]
+        h = self.head[s]
+        return self.data[s, h:h + self.size[s]]
+
+    def last(self, key):
+        return self.get(key)[-1]
+
+    def at(self, key, times, columns=None):
+        """Rows (or columns) of key at the given times, NaN where it has no row at that time."""
+        hist = self.get(key)
+        stamps = hist[:, self.time_col]
+        times = np.asarray(times, dtype=float)
+        i = np.minimum(np.searchsorted(stamps, times), len(stamps) - 1)
+        rows = hist[i] if columns is None else hist[i][:, [self.col[column] for column in columns]]
+        rows[stamps[i] != times] = np.nan
+        return rows
+
+class TrajResampler(object):
+    """
+    Fixed-rate view of TrajStore histories: the points of a key at rate [Hz]
+    over the last `length` grid times ending at its latest row, linearly
+    interpolated from the stored (already projected) rows.
+
+    Results are cached per key and extended incrementally, only grid times
+    past the cached end are interpolated. Histories shorter than the window
+    give the grid points they cover.
+    """
+    def __init__(self, columns=('x', 'y'), rate=1.0, length=121):
+
+        self.columns = list(columns)
+        self.step    = int(round(1000 / rate))
+        self.length  = length
+        self.cache   = {}
+
+    def interp(self, times, values, grid):
+        return np.stack([np.interp(grid, times, values[:, i]) for i in range(values.shape[1])], axis=1)
+
+    def get(self, store, key):
+        """[n <= length, columns] resampled points of key, oldest first."""
+        hist = store.get(key)
+        times = np.round(hist[:, store.time_col] * 1000).astype(np.int64)
+        values = hist[:, [store.col[column] for column in self.columns]]
+        end = int(times[-1])
+
+        cached = self.cache.get(key)
+        if cached is not None and times[0] <= cached[0] <= end and (end - cached[0]) % self.step == 0:
+            new = min((end - cached[0]) // self.step, self.length)
+            # the new grid times only need the rows from the cached end on
+            first = int(np.searchsorted(times, cached[0], side='left'))
+            grid = end - self.step * np.arange(new - 1, -1, -1, dtype=np.int64)
+            points = np.concatenate([cached[1], self.interp(times[first:], values[first:], grid)])[-self.length:]
+        else:
+            grid = end - self.step * np.arange(self.length - 1, -1, -1, dtype=np.int64)
+            grid = grid[grid >= times[0]]
+            points = self.interp(times, values, grid)
+
+        # grid times older than the first stored row (rows evicted from the ring)
+        start = end - self.step * (len(points) - 1)
+        if start < times[0]:
+            points = points[-((end - times[0]) // self.step + 1):]
+        self.cache[key] = (end, points)
+        return points
+
+    def prune(self, store):
+        """Forget keys no longer in store."""
+        for key in [key for key in self.cache if key not in store]:
+            del self.cache[key]
+
+class MeanAccumulator(object):
+    """
+    Running per-key sums and counts of numeric rows in preallocated arrays.
+    means() gives every key's mean row in first-seen order in one step;
+    reset() clears the keys without freeing the arrays.
+    """
+    def __init__(self, columns, slots=64):
+
+        self.columns = list(columns)
+        self.sums    = np.zeros((slots, len(self.columns)))
+        self.count   = np.zeros(slots, dtype=np.int64)
+        self.keys    = np.zeros(slots, dtype=np.int64)
+        self.slot    = {}
+
+    def __len__(self):
+        return len(self.slot)
+
+    def grow(self):
+
+        self.sums  = np.concatenate([self.sums, np.zeros_like(self.sums)])
+        self.count = np.concatenate([self.count, np.zeros_like(self.count)])
+        self.keys  = np.concatenate([self.keys, np.zeros_like(self.keys)])
+
+    def add(self, key, row):
+
+        s = self.slot.get(key)
+        if s is None:
+            s = len(self.slot)
+            if s == len(self.count):
+                self.grow()
+            self.slot[key] = s
+            self.keys[s] = key
+        self.sums[s] += row
+        self.count[s] += 1
+
+    def means(self):
+        """(keys, [keys, columns] mean rows)"""
+        n = len(self.slot)
+        return self.keys[:n].copy(), self.sums[:n] / self.count[:n, None]
+
+    def reset(self):
+
+        n = len(self.slot)
+        self.sums[:n] = 0
+        self.count[:n] = 0
+        self.slot.clear()
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from utils.schema import AIS, empty_frame
+
+class VesselTable(object):
+    """
+    Latest state of every vessel, one row per key (mmsi).
+
+    States live in a [slots, columns] array addressed through a key -> slot dict,
+    so membership and last-state lookups are O(1) per vessel. `seen` holds the
+    time of each vessel's last report; evict() drops vessels not heard from since
+    a given time. `order` keeps the row order of to_frame(): vessels reported by
+    the latest update first (in report order), then the others in their previous
+    order.
+    """
+    def __init__(self, schema=AIS, key='mmsi', time_column='timestamp', slots=256):
+
+        self.schema   = schema
+        self.key      = key
+        self.columns  = list(schema)
+        self.col      = {column: i for i, column in enumerate(self.columns)}
+        self.time_col = self.col[time_column]
+        self.data     = np.zeros((slots, len(self.columns)))
+        self.seen     = np.zeros(slots)
+        self.slot     = {}
+        self.free     = list(range(slots - 1, -1, -1))
+        self.order    = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.slot)
+
+    def __contains__(self, key):
+        return key in self.slot
+
+    def keys(self):
+        return self.slot.keys()
+
+    def grow(self):
+
+        slots = len(self.seen)
+        self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+        self.seen = np.concatenate([self.seen, np.zeros(slots)])
+        self.free = list(range(2*slots - 1, slots - 1, -1))
+
+    def get_slot(self, key):
+
+        s = self.slot.get(key)
+        if s is None:
+            if not self.free:
+                self.grow()
+            s = self.free.pop()
+            self.slot[key] = s
+        return s
+
+    def lookup(self, keys):
+        """Slot of every key, -1 for unknown keys."""
+        return np.array([self.slot.get(key, -1) for key in keys], dtype=np.int64)
+
+    def get(self, key):
+        """State row of key (a view), None if unknown."""
+        s = self.slot.get(key)
+        return None if s is None else self.data[s]
+
+    def states(self, keys, columns):
+        """[len(keys), len(columns)] states of keys, NaN rows for unknown keys."""
+        rows = self.lookup(keys)
+        values = self.data[rows][:, [self.col[column] for column in columns]]
+        values[rows < 0] = np.nan
+        return values
+
+    def update(self, df, seen=None):
+        """
+        Store the rows of df as the latest states (the last row wins for a key
+        reported twice). seen defaults to the rows' own time column.
+        """
+        if len(df) == 0:
+            return
+        keys = df[self.key].to_numpy(dtype=np.int64)
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        last.sort()
+        rows = df.reindex(columns=self.columns).to_numpy(dtype=float)[last]
+        seen = rows[:, self.time_col] if seen is None else np.broadcast_to(np.asarray(seen, dtype=float), len(keys))[last]
+
+        slots = np.array([self.get_slot(key) for key in keys[last].tolist()], dtype=np.int64)
+        self.data[slots] = rows
+        self.seen[slots] = seen
+
+        reported = np.zeros(len(self.seen), dtype=bool)
+        reported[slots] = True
+        self.order = np.concatenate([slots, self.order[~reported[self.order]]])
+
+    def assign(self, df):
+        """Overwrite all states with df, a modified to_frame() (same rows, same order)."""
+        self.data[self.order] = df.reindex(columns=self.columns).to_numpy(dtype=float)
+
+    def remove(self, key):
+
+        s = self.slot.pop(key, None)
+        if s is not None:
+            self.free.append(s)
+            self.order = self.order[self.order != s]
+
+    def evict(self, min_seen):
+        """Drop every vessel whose last report is older than min_seen."""
+        stale = self.seen[self.order] < min_seen
+        if not stale.any():
+            return
+        stale_slots = set(self.order[stale].tolist())
+        for key, s in list(self.slot.items()):
+            if s in stale_slots:
+                del self.slot[key]
+                self.free.append(s)
+        self.order = self.order[~stale]
+
+    def to_frame(self):
+
+        if not len(self.order):
+            return empty_frame(self.schema)
+        # optional fields (heading, type) are float in the schema, NaN rows survive the cast
+        df = pd.DataFrame(self.data[self.order], columns=self.columns)
+        return df.astype(self.schema)